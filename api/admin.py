@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Category, Product
+from .models import Category, Product, OutboundEmail
 
 # Register your models here.
 admin.site.register(Category)
-admin.site.register(Product)
\ No newline at end of file
+admin.site.register(Product)
+admin.site.register(OutboundEmail)
\ No newline at end of file
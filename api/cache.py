@@ -0,0 +1,68 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# Cache key holding the current catalog version; bumping it orphans every cached listing at once
+CATALOG_VERSION_KEY = 'catalog:version'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_catalog_version():
+    cache = get_catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a lost version key can't resurrect entries cached under an old version
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache = get_catalog_cache()
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_catalog():
+    # Bump once the surrounding transaction commits so no request can cache pre-commit data under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+# Key of a cached catalog response; validator identifies the rows (ids, max(updated_at)) it was rendered from
+def catalog_cache_key(prefix, request, query_params, url_kwargs, validator):
+    params = request.query_params
+    parts = [f'{name}={params.get(name, "").strip()}' for name in sorted(query_params) if params.get(name)]
+    parts += [f'{name}={value}' for name, value in sorted(url_kwargs.items())]
+    return f'catalog:{get_catalog_version()}:{request.get_host()}:{prefix}:{validator}:{"&".join(parts)}'
+
+
+def record_cache_lookup(hit):
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+
+
+def get_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def get_user_cache():
+    return caches[settings.AUTH_USER_CACHE_ALIAS]
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    transaction.on_commit(lambda: get_user_cache().delete(user_cache_key(user_id)))
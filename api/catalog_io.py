@@ -0,0 +1,180 @@
+import csv
+import io
+import json
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from .cache import invalidate_catalog
+from .models import Category, Product
+
+# Columns read on import and written on export, in order
+PRODUCT_COLUMNS = ['sku', 'name', 'description', 'price', 'stock', 'category', 'image']
+FORMATS = ['csv', 'jsonl']
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100  # Row errors listed in an import result; the rest are only counted
+
+
+# Guess the file format from a file name, defaulting to CSV
+def format_from_name(name):
+    return 'jsonl' if name and name.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+# Yield one row per record from a binary stream, without reading the whole file into memory.
+# CSV rows are dicts; JSONL lines are yielded unparsed so a malformed line is reported by parse_row
+# like any other invalid row instead of aborting the import. utf-8-sig drops the byte-order mark
+# spreadsheet applications (e.g. Excel) write, which would otherwise end up in the first column name.
+def read_rows(stream, fmt):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        yield from csv.DictReader(text)
+    else:
+        for line in text:
+            if line.strip():
+                yield line
+
+
+# Text value of a column, stripped; JSON rows may hold numbers or other types where text is expected
+def text_value(row, column):
+    value = row.get(column)
+    return '' if value is None else str(value).strip()
+
+
+# Parse an import row into a dict, raising ValueError if it isn't one
+def parse_row(row):
+    if isinstance(row, str):
+        row = json.loads(row)  # JSONDecodeError is a ValueError
+    if not isinstance(row, dict):
+        raise ValueError('row must be an object')
+    if len(text_value(row, 'category')) > Category._meta.get_field('name').max_length:
+        raise ValueError('category name is too long')
+    return row
+
+
+# Convert a value with the model field's own validation (type, length, max_digits, finite decimals)
+def clean_field(name, value):
+    try:
+        return Product._meta.get_field(name).clean(value, None)
+    except ValidationError as e:
+        raise ValueError(f'invalid {name}: {" ".join(e.messages)}')
+
+
+# Build an unsaved Product from a parsed import row, raising ValueError for invalid rows
+def build_product(row, category_ids, now):
+    sku = text_value(row, 'sku')
+    name = text_value(row, 'name')
+    if not sku or not name:
+        raise ValueError('sku and name are required')
+
+    category_name = text_value(row, 'category')
+    return Product(
+        sku=clean_field('sku', sku),
+        name=clean_field('name', name),
+        description=str(row.get('description') or ''),
+        price=clean_field('price', row.get('price')),
+        stock=clean_field('stock', row.get('stock') or 0),
+        category_id=category_ids.get(category_name) if category_name else None,
+        image=clean_field('image', text_value(row, 'image') or None),
+        updated_at=now,
+    )
+
+
+# Resolve category names to ids through the in-memory map, creating any that don't exist yet
+def resolve_categories(rows, category_ids):
+    new_names = {text_value(row, 'category') for row in rows} - set(category_ids) - {''}
+    if new_names:
+        Category.objects.bulk_create([Category(name=name) for name in new_names])
+        category_ids.update(Category.objects.filter(name__in=new_names).values_list('name', 'id'))
+
+
+# Import rows in chunks, upserting products on sku; memory is bounded by the chunk size.
+# Invalid rows are skipped and counted; the first MAX_REPORTED_ERRORS are reported by row number.
+def import_products(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    category_ids = dict(Category.objects.values_list('name', 'id'))
+    imported, errors, error_count = 0, [], 0
+    rows = iter(rows)
+    line = 0
+
+    def report(row_number, error):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(f'Row {row_number}: {error}')
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        parsed = []
+        for row in chunk:
+            line += 1
+            try:
+                parsed.append((line, parse_row(row)))
+            except ValueError as e:
+                report(line, e)
+
+        resolve_categories([row for _, row in parsed], category_ids)
+        now = timezone.now()
+        products = {}
+        for row_number, row in parsed:
+            try:
+                product = build_product(row, category_ids, now)
+            except ValueError as e:
+                report(row_number, e)
+                continue
+            products[product.sku] = product  # Last row wins when a sku repeats within a chunk
+
+        Product.objects.bulk_create(
+            products.values(),
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=['name', 'description', 'price', 'stock', 'category', 'image', 'updated_at'],
+        )
+        imported += len(products)
+
+    if imported:
+        invalidate_catalog()  # bulk_create sends no signals
+    return {'imported': imported, 'errors': errors, 'error_count': error_count}
+
+
+# Buffer-less file object for csv.writer, so each row can be yielded as soon as it's written
+class Echo:
+    def write(self, value):
+        return value
+
+
+# Database fields read on export, in PRODUCT_COLUMNS order
+EXPORT_FIELDS = ['sku', 'name', 'description', 'price', 'stock', 'category__name', 'image']
+
+
+# Catalog rows for export; values() rather than values_list(), whose iterator runs its query
+# as soon as it is created and so can't be used from aiterator() on Django 4.2
+def export_queryset():
+    return Product.objects.order_by('id').values(*EXPORT_FIELDS)
+
+
+# Format one export row as a CSV or JSONL line
+def format_row(row, fmt, writer):
+    values = [row[field] for field in EXPORT_FIELDS]
+    if fmt == 'csv':
+        return writer.writerow(values)
+    return json.dumps(dict(zip(PRODUCT_COLUMNS, values)), default=str) + '\n'
+
+
+# Yield the whole catalog as CSV or JSONL lines, streaming rows from the database in chunks
+def export_products(fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    if fmt == 'csv':
+        yield writer.writerow(PRODUCT_COLUMNS)
+    for row in export_queryset().iterator(chunk_size=chunk_size):
+        yield format_row(row, fmt, writer)
+
+
+# Async counterpart of export_products for streaming responses: under ASGI, Django collects a sync
+# iterator into a list before sending it, which would hold the whole catalog in memory
+async def aexport_products(fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    if fmt == 'csv':
+        yield writer.writerow(PRODUCT_COLUMNS)
+    async for row in export_queryset().aiterator(chunk_size=chunk_size):
+        yield format_row(row, fmt, writer)
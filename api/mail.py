@@ -0,0 +1,123 @@
+import time
+from datetime import timedelta
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from .models import OutboundEmail
+
+# Retry schedule for failed deliveries: RETRY_BASE_DELAY * 2 ** (attempts - 1), capped at RETRY_MAX_DELAY
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+MAX_ATTEMPTS = 8
+
+
+# Queue an email for the background worker; same arguments as django.core.mail.send_mail
+def queue_mail(subject, message, from_email, recipient_list):
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email,
+        recipients=list(recipient_list),
+    )
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+# Count a failed attempt against an email, scheduling a retry or giving up after max_attempts
+def record_failure(email, error, max_attempts):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+
+# Claimed emails are hidden from other workers for this long; if the worker dies mid-batch the unsent
+# ones become due again when it expires. A batch stops sending once half of it has passed.
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+# Fields written back after a delivery attempt
+RESULT_FIELDS = ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+
+
+# Claim up to batch_size due emails by pushing their next attempt past CLAIM_TIMEOUT, in one short transaction
+def claim_due_mail(batch_size):
+    with transaction.atomic():
+        # skip_locked lets several workers claim at once without blocking on (or taking) the same rows
+        emails = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if emails:
+            OutboundEmail.objects.filter(id__in=[email.id for email in emails]).update(
+                next_attempt_at=timezone.now() + CLAIM_TIMEOUT
+            )
+    return emails
+
+
+# Send one batch of due emails over a single SMTP connection and return per-batch statistics;
+# latencies are the seconds each successful SMTP send took. No transaction or row lock is held
+# while talking to the mail server (EMAIL_TIMEOUT bounds each SMTP operation).
+def send_queued_mail(batch_size=100, max_attempts=MAX_ATTEMPTS):
+    sent, failed, latencies = 0, 0, []
+
+    emails = claim_due_mail(batch_size)
+    if not emails:
+        return {'sent': 0, 'failed': 0, 'latencies': []}
+    deadline = time.monotonic() + CLAIM_TIMEOUT.total_seconds() / 2
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # Mail server unreachable: back off the whole batch rather than crashing the worker
+        for email in emails:
+            record_failure(email, e, max_attempts)
+        OutboundEmail.objects.bulk_update(emails, RESULT_FIELDS)
+        return {'sent': 0, 'failed': len(emails), 'latencies': []}
+
+    try:
+        for index, email in enumerate(emails):
+            if time.monotonic() > deadline:
+                # Hand the rest back before the claim expires and another worker sends them too
+                OutboundEmail.objects.filter(id__in=[unsent.id for unsent in emails[index:]]).update(next_attempt_at=timezone.now())
+                break
+
+            message = EmailMessage(email.subject, email.body, email.from_email, email.recipients, connection=connection)
+            started = time.monotonic()
+            try:
+                message.send()
+            except Exception as e:
+                failed += 1
+                record_failure(email, e, max_attempts)
+            else:
+                sent += 1
+                latencies.append(time.monotonic() - started)
+                email.attempts += 1
+                email.status = 'sent'
+                email.sent_at = timezone.now()
+            # Record each result as soon as it is known, so a crash can only resend the email that was in flight
+            email.save(update_fields=RESULT_FIELDS)
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass  # The messages have already been handed over; a failed QUIT must not lose their status
+
+    return {'sent': sent, 'failed': failed, 'latencies': latencies}
+
+
+# Queue depth metrics: pending and failed counts, and the age in seconds of the oldest pending email
+def outbox_metrics():
+    pending = OutboundEmail.objects.filter(status='pending')
+    oldest = pending.aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'pending': pending.count(),
+        'failed': OutboundEmail.objects.filter(status='failed').count(),
+        'oldest_pending_age': (timezone.now() - oldest).total_seconds() if oldest else 0,
+    }
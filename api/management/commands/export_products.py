@@ -0,0 +1,23 @@
+import sys
+from django.core.management.base import BaseCommand
+from api.catalog_io import DEFAULT_CHUNK_SIZE, FORMATS, export_products, format_from_name
+
+
+class Command(BaseCommand):
+    help = 'Export the product catalog as CSV or JSONL, streaming rows from the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file (default: stdout)')
+        parser.add_argument('--format', choices=FORMATS, help='File format (guessed from the extension by default)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows fetched per database round-trip')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or format_from_name(path)
+        output = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            for line in export_products(fmt, chunk_size=options['chunk_size']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
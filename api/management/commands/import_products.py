@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.catalog_io import DEFAULT_CHUNK_SIZE, FORMATS, format_from_name, import_products, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import products from a CSV or JSONL file, upserting on sku in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument('--format', choices=FORMATS, help='File format (guessed from the extension by default)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows written per bulk statement')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or format_from_name(options['path'])
+        try:
+            with open(options['path'], 'rb') as f:
+                result = import_products(read_rows(f, fmt), chunk_size=options['chunk_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for error in result['errors']:
+            self.stderr.write(error)
+        if result['error_count'] > len(result['errors']):
+            self.stderr.write(f"... and {result['error_count'] - len(result['errors'])} more invalid rows")
+        self.stdout.write(f"Imported {result['imported']} products ({result['error_count']} rows skipped)")
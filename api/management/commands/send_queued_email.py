@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand
+from api.mail import MAX_ATTEMPTS, outbox_metrics, send_queued_mail
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbound email in batches, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails sent per SMTP connection')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help='Attempts before an email is marked failed')
+        parser.add_argument('--once', action='store_true', help='Drain the due emails once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                result = send_queued_mail(batch_size=options['batch_size'], max_attempts=options['max_attempts'])
+            except Exception as e:
+                # e.g. the database is briefly unavailable; keep the worker alive and try again
+                self.stderr.write(f'Failed to send queued email: {e}')
+                if options['once']:
+                    raise
+                time.sleep(options['interval'])
+                continue
+
+            if result['sent'] or result['failed']:
+                latencies = result['latencies']
+                metrics = outbox_metrics()
+                self.stdout.write(
+                    f"Sent {result['sent']} emails, {result['failed']} failed; "
+                    f"queue depth {metrics['pending']} (oldest {metrics['oldest_pending_age']:.1f}s), "
+                    f"{metrics['failed']} permanently failed; "
+                    f"send latency avg {sum(latencies) / len(latencies) if latencies else 0:.2f}s "
+                    f"max {max(latencies, default=0):.2f}s"
+                )
+                continue  # More mail may be due right away
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,137 @@
+import zlib
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # Optional dependency: only gzip is offered without it
+    brotli = None
+
+# API payload types worth compressing. HTML (admin, browsable API) is left alone: those pages carry
+# CSRF tokens, and compressing secrets next to reflected input exposes them to BREACH.
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+}
+
+# Bytes of input a streaming compressor takes before it flushes, so tiny chunks still compress well
+STREAM_FLUSH_SIZE = 16 * 1024
+
+
+# Incremental gzip compressor
+class GzipCompressor:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # 16+ writes a gzip header
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+# Incremental brotli compressor
+class BrotliCompressor:
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+# Content codings with a non-zero q value in an Accept-Encoding header
+def accepted_encodings(header):
+    encodings = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        q = params.strip().replace(' ', '')
+        if coding and q not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            encodings.add(coding)
+    return encodings
+
+
+# Compress each chunk of a streamed body, flushing every STREAM_FLUSH_SIZE bytes of input
+def compress_stream(chunks, compressor):
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH_SIZE:
+            data += compressor.flush()
+            pending = 0
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+# Async counterpart of compress_stream for async iterators (e.g. the NDJSON product feed)
+async def acompress_stream(chunks, compressor):
+    pending = 0
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH_SIZE:
+            data += compressor.flush()
+            pending = 0
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+# Negotiated brotli/gzip compression for API responses (JSON, NDJSON, CSV) above a size threshold
+class CompressionMiddleware(MiddlewareMixin):
+    def get_compressor(self, request):
+        encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in encodings:
+            return 'br', BrotliCompressor(settings.COMPRESSION_BROTLI_QUALITY)
+        if 'gzip' in encodings:
+            return 'gzip', GzipCompressor(settings.COMPRESSION_GZIP_LEVEL)
+        return None, None
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in COMPRESSIBLE_TYPES or response.has_header('Content-Encoding'):
+            return response
+
+        # It's not worth compressing small payloads; streamed bodies have no known size and always qualify
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding, compressor = self.get_compressor(request)
+        if compressor is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(response.streaming_content, compressor)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, compressor)
+            del response.headers['Content-Length']  # Unknown until the stream has been sent
+        else:
+            # Keep the original body if compression doesn't make it smaller
+            compressed = compressor.compress(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The compressed body is a different representation, so a strong ETag becomes weak (RFC 9110 8.8.1);
+        # If-None-Match uses weak comparison, so 304 responses still match
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:07
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# PostgreSQL only: keep search_vector in sync on insert and whenever name or description
+# change, backfill existing rows and index the vector with GIN
+CREATE_SEARCH_SQL = """
+CREATE FUNCTION api_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' OR NEW.search_vector IS NULL
+            OR NEW.name IS DISTINCT FROM OLD.name
+            OR NEW.description IS DISTINCT FROM OLD.description THEN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER api_product_search_vector_trigger
+BEFORE INSERT OR UPDATE ON api_product
+FOR EACH ROW EXECUTE FUNCTION api_product_search_vector_update();
+
+UPDATE api_product SET search_vector =
+    setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B');
+
+CREATE INDEX product_search_vector_idx ON api_product USING GIN (search_vector);
+"""
+
+DROP_SEARCH_SQL = """
+DROP INDEX IF EXISTS product_search_vector_idx;
+DROP TRIGGER IF EXISTS api_product_search_vector_trigger ON api_product;
+DROP FUNCTION IF EXISTS api_product_search_vector_update();
+"""
+
+
+def create_search_objects(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_SQL)
+
+
+def drop_search_objects(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_product_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_objects, drop_search_objects),
+    ]
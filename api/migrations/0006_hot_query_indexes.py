@@ -0,0 +1,46 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:07
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+# Collapse duplicate cart lines into one per (cart, product) so the unique constraint can be added
+def merge_duplicate_cart_items(apps, schema_editor):
+    CartItem = apps.get_model('api', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'product_id')
+        .annotate(lines=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for duplicate in duplicates:
+        CartItem.objects.filter(id=duplicate['keep_id']).update(quantity=duplicate['total'])
+        CartItem.objects.filter(
+            cart_id=duplicate['cart_id'], product_id=duplicate['product_id']
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'created_at'], name='product_category_created_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
@@ -1,5 +1,10 @@
-from django.db import models
+from django.db import models, connections
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+
+# Text search configuration used for Product.search_vector and search queries
+SEARCH_CONFIG = 'english'
 
 # Profile model to extend the default Django User model with additional fields
 class Profile(models.Model):
@@ -13,12 +18,41 @@ class Profile(models.Model):
 class Category(models.Model):
     name = models.CharField(max_length=255)                      # Name of the category
     description = models.TextField(blank=True, null=True)        # Optional description of the category
+    updated_at = models.DateTimeField(auto_now=True)             # Timestamp for when the category was last updated
 
     def __str__(self):
         return self.name  # Returns the name of the category
 
+# Custom queryset for Product with full-text search support
+class ProductQuerySet(models.QuerySet):
+    def search(self, query):
+        if connections[self.db].vendor == 'postgresql':
+            # Weighted tsvector match (name over description) backed by the GIN index, ranked by relevance
+            search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+            return self.filter(search_vector=search_query).annotate(
+                rank=SearchRank(models.F('search_vector'), search_query)
+            ).order_by('-rank', '-id')
+
+        # Portable fallback for databases without tsvector support (e.g. SQLite in development),
+        # still matching description and ranking name matches first
+        return self.filter(
+            models.Q(name__icontains=query) | models.Q(description__icontains=query)
+        ).annotate(
+            rank=models.Case(
+                models.When(name__icontains=query, then=models.Value(1.0)),
+                default=models.Value(0.5),
+                output_field=models.FloatField(),
+            )
+        ).order_by('-rank', '-id')
+
+# Manager for Product that never loads the search vector unless asked for
+class ProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
 # Product model to represent products in the store
 class Product(models.Model):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # Optional stock keeping unit, the natural key for bulk import
     name = models.CharField(max_length=255)                      # Name of the product
     description = models.TextField()                             # Detailed description of the product
     price = models.DecimalField(max_digits=10, decimal_places=2) # Price of the product
@@ -27,18 +61,70 @@ class Product(models.Model):
     image = models.CharField(max_length=500, null=True, blank=True) # Optional URL to product image
     created_at = models.DateTimeField(auto_now_add=True)         # Timestamp for when the product was created
     updated_at = models.DateTimeField(auto_now=True)             # Timestamp for when the product was last updated
+    search_vector = SearchVectorField(null=True, editable=False)  # Weighted name/description vector, maintained by a database trigger on PostgreSQL
+
+    objects = ProductManager()
+
+    CARD_FIELDS = ['id', 'name', 'price', 'image']  # Fields of the compact "card" representation used in lists and carts
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),  # Keyset pagination on ProductList
+            models.Index(fields=['name'], name='product_name_idx'),                      # Lookups and ordering by name
+            models.Index(fields=['category', 'created_at'], name='product_category_created_idx'),  # ProductList filtered by category
+            models.Index(fields=['updated_at', 'id'], name='product_updated_id_idx'),   # Incremental catalog feed (updated_at > since)
+        ]
 
     def __str__(self):
         return self.name  # Returns the name of the product
 
+# Custom queryset for Cart with helpers for loading a cart efficiently
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        # Load items with their products up front so serializing a cart
+        # costs the same number of queries however many lines it has
+        return self.prefetch_related(
+            models.Prefetch('items', queryset=CartItem.objects.select_related('product').only(
+                'id', 'cart_id', 'product_id', 'quantity', 'created_at', 'updated_at',
+                *[f'product__{field}' for field in Product.CARD_FIELDS],  # Only the columns of the product card
+            ))
+        )
+
 # Cart model to represent a shopping cart for a user
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)  # Links to the Django User model, one-to-one relationship
     created_at = models.DateTimeField(auto_now_add=True)         # Timestamp for when the cart was created
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return f"Cart of {self.user.username}"  # Returns a string representation of the cart and the associated user
 
+# Custom queryset for CartItem with set-based quantity updates
+class CartItemQuerySet(models.QuerySet):
+    # Add quantities ({product_id: quantity}) to a cart in one INSERT ... ON CONFLICT statement,
+    # creating missing lines and atomically incrementing existing ones; returns the affected lines
+    def add_quantities(self, cart_id, quantities):
+        if not quantities:
+            return []
+
+        connection = connections[self.db]
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(quantities))
+        params = []
+        for product_id, quantity in quantities.items():
+            params += [cart_id, product_id, quantity, now, now]
+
+        return list(self.model.objects.raw(
+            f'INSERT INTO {table} (cart_id, product_id, quantity, created_at, updated_at) VALUES {values} '
+            f'ON CONFLICT (cart_id, product_id) DO UPDATE SET '
+            f'quantity = {table}.quantity + EXCLUDED.quantity, updated_at = EXCLUDED.updated_at '
+            f'RETURNING id, cart_id, product_id, quantity, created_at, updated_at',
+            params,
+            using=self.db,
+        ))
+
 # CartItem model to represent items in a shopping cart
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)  # Foreign key to Cart
@@ -47,6 +133,13 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)                            # Timestamp for when the cart item was created
     updated_at = models.DateTimeField(auto_now=True)                                # Timestamp for when the cart item was last updated
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),  # One line per product in a cart
+        ]
+
     def __str__(self):
         return f"{self.product.name} ({self.quantity})"  # Returns a string representation of the product and its quantity in the cart
 
@@ -64,6 +157,11 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)                         # Timestamp for when the order was created
     updated_at = models.DateTimeField(auto_now=True)                             # Timestamp for when the order was last updated
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),  # Order history per user
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"  # Returns a string representation of the order and the associated user
 
@@ -76,3 +174,30 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} ({self.quantity})"  # Returns a string representation of the product and its quantity in the order
+
+# OutboundEmail model to queue outgoing mail for delivery by the send_queued_email worker
+class OutboundEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),  # Waiting to be sent (or retried)
+        ('sent', 'Sent'),        # Delivered to the mail server
+        ('failed', 'Failed'),    # Gave up after the maximum number of attempts
+    ]
+
+    subject = models.CharField(max_length=255)                                   # Subject line of the email
+    body = models.TextField()                                                    # Plain text body of the email
+    from_email = models.CharField(max_length=255)                                # Sender address
+    recipients = models.JSONField()                                              # List of recipient addresses
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')  # Delivery status of the email
+    attempts = models.PositiveIntegerField(default=0)                            # Number of delivery attempts so far
+    next_attempt_at = models.DateTimeField(default=timezone.now)                 # Earliest time of the next delivery attempt
+    last_error = models.TextField(blank=True)                                    # Error from the last failed attempt
+    created_at = models.DateTimeField(auto_now_add=True)                         # Timestamp for when the email was queued
+    sent_at = models.DateTimeField(null=True, blank=True)                        # Timestamp for when the email was sent
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),  # Worker polling for due mail
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"  # Returns a string representation of the email and its status
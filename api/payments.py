@@ -0,0 +1,29 @@
+import stripe
+from django.conf import settings
+
+_stripe_client = None
+
+
+# Shared Stripe client whose async httpx connection pool is reused across requests
+def get_stripe_client():
+    global _stripe_client
+    if _stripe_client is None:
+        base_addresses = {'api': settings.STRIPE_API_BASE} if settings.STRIPE_API_BASE else {}
+        _stripe_client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            base_addresses=base_addresses,
+            max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,  # Safe to retry: every call carries an idempotency key
+            http_client=stripe.HTTPXClient(timeout=settings.STRIPE_TIMEOUT),
+        )
+    return _stripe_client
+
+
+async def create_payment_intent(amount, idempotency_key, currency='usd'):
+    return await get_stripe_client().payment_intents.create_async(
+        params={
+            'amount': amount,  # amount in cents
+            'currency': currency,
+            'metadata': {'integration_check': 'accept_a_payment'},
+        },
+        options={'idempotency_key': idempotency_key},
+    )
@@ -0,0 +1,44 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # Optional dependency: fall back to DRF's stdlib json implementation
+    orjson = None
+
+# Datetimes go through DRF's encoder (millisecond precision, "Z" suffix) so output matches JSONRenderer
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+
+# JSONRenderer producing the same bytes as DRF's, encoded with orjson when it is installed
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        # Indented output (e.g. "application/json; indent=4") and non-compact settings keep the stdlib path
+        renderer_context = renderer_context or {}
+        if orjson is None or not self.compact or self.ensure_ascii \
+                or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except TypeError:  # e.g. integers beyond 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Match JSONRenderer, which escapes these because they are invalid in JavaScript strings
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+# JSONParser decoding request bodies with orjson when it is installed
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -1,5 +1,13 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+import decimal
 from django.contrib.auth.models import User
-from rest_framework import serializers
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .cache import invalidate_catalog
 from .models import Profile, Category, Product, Cart, CartItem, Order, OrderItem
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
@@ -35,13 +43,16 @@ class UserSerializer(serializers.ModelSerializer):
         instance.email = validated_data.get('email', instance.email)
         instance.save()
 
+        # Only write the profile when one of its fields actually changed
         profile = instance.profile
-        profile.phone_number = profile_data.get('phone_number', profile.phone_number)
-        profile.save()
+        phone_number = profile_data.get('phone_number', profile.phone_number)
+        if phone_number != profile.phone_number:
+            profile.phone_number = phone_number
+            profile.save(update_fields=['phone_number'])
 
         return instance
 
-# Serializer for user registration, creating a user and their profile
+# Serializer for user registration, creating a user (and, through the signal, their profile)
 class RegisterSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -53,8 +64,7 @@ class RegisterSerializer(serializers.ModelSerializer):
             username=validated_data['username'],
             email=validated_data['email'],
             password=validated_data['password']
-        )
-        Profile.objects.create(user=user)  # Create an associated profile for the new user
+        )  # The associated profile is created once by the post_save signal
         return user
 
 # Serializer for the Category model
@@ -63,17 +73,92 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = '__all__'
 
-# Serializer for the Product model
-class ProductSerializer(serializers.ModelSerializer):
+# ModelSerializer that takes an optional `fields` argument restricting which fields are serialized
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+# Compile a converter from a raw .values() value to exactly what the serializer field would render.
+# Plain decimal and ISO 8601 datetime fields get precomputed fast paths; anything else uses the field itself.
+def compile_converter(field):
+    # Related fields render the primary key, which .values() already returns
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        return None
+
+    if (isinstance(field, serializers.DecimalField) and field.decimal_places is not None
+            and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+            and not field.localize and not field.normalize_output):
+        exponent = Decimal('.1') ** field.decimal_places
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+        rounding = field.rounding
+
+        def convert_decimal(value):
+            if not isinstance(value, Decimal):
+                return field.to_representation(value)
+            return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+        return convert_decimal
+
+    if isinstance(field, serializers.DateTimeField):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if output_format is not None and output_format.lower() == ISO_8601 and field_timezone is not None:
+            def convert_datetime(value):
+                if not isinstance(value, datetime) or timezone.is_naive(value):
+                    return field.to_representation(value)
+                value = value.astimezone(field_timezone).isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return convert_datetime
+
+    return field.to_representation
+
+# Read-only fast path for list endpoints: builds the same dicts as a ModelSerializer straight from
+# .values() rows, using converters compiled once per request from the serializer's own fields
+class ValuesSerializer:
+    def __init__(self, serializer):
+        self.columns = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            self.columns.append((name, field.source, compile_converter(field)))
+
+    @property
+    def sources(self):
+        return [source for name, source, convert in self.columns]
+
+    def to_representation(self, rows):
+        columns = self.columns
+        return [
+            {
+                name: row[source] if convert is None or row[source] is None else convert(row[source])
+                for name, source, convert in columns
+            }
+            for row in rows
+        ]
+
+# Serializer for the Product model (supports sparse fieldsets)
+class ProductSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['search_vector']
+
+# Compact "card" serializer for a product embedded in carts and other payloads
+class ProductSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = Product.CARD_FIELDS
 
 # Serializer for the CartItem model
 class CartItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField(write_only=True)
     quantity = serializers.IntegerField()
-    product = ProductSerializer(read_only=True)
+    product = ProductSummarySerializer(read_only=True)
 
     class Meta:
         model = CartItem
@@ -85,6 +170,18 @@ class CartItemSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+# Serializer for one operation of a batch cart update
+class CartBatchOperationSerializer(serializers.Serializer):
+    OPERATION_CHOICES = ['set', 'add', 'remove']
+
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, default=1)
+    op = serializers.ChoiceField(choices=OPERATION_CHOICES, default='set')
+
+# Serializer for a batch cart update: a list of operations applied in order
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartBatchOperationSerializer(many=True, allow_empty=False, max_length=500)
+
 # Serializer for the Cart model
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
@@ -99,6 +196,13 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = '__all__'
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Optionally embed a product summary so clients don't need a request per line
+        if self.context.get('embed_product'):
+            data['product_summary'] = ProductSummarySerializer(instance.product).data
+        return data
+
 # Serializer for the Order model
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
@@ -111,24 +215,57 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context['request'].user
-        order = Order.objects.create(user=user, total_price=0)  # Initial total_price, will update later
 
-        cart_items = CartItem.objects.filter(cart__user=user)
-        total_price = 0
+        with transaction.atomic():
+            # Lock the cart before reading its lines, so a concurrent second checkout (e.g. a double-click)
+            # waits for this one to commit and then finds the cart empty. The lines are locked too: the add
+            # endpoints upsert lines without touching the cart row, and an add landing on a line between
+            # this read and the delete below would otherwise be deleted without being ordered
+            cart = Cart.objects.select_for_update().filter(user=user).first()
+            cart_items = list(CartItem.objects.select_for_update().filter(cart=cart).order_by('id')) if cart is not None else []
+            if not cart_items:
+                raise serializers.ValidationError({'detail': 'Your cart is empty'})
+
+            quantities = defaultdict(int)
+            for item in cart_items:
+                quantities[item.product_id] += item.quantity
+
+            # Lock the ordered products in a fixed (id) order so concurrent checkouts on the
+            # same products serialize on their rows instead of deadlocking or overselling
+            products = {
+                product.id: product
+                for product in Product.objects.select_for_update().filter(id__in=quantities).order_by('id')
+            }
+
+            out_of_stock = [
+                products[product_id].name for product_id, quantity in quantities.items()
+                if products[product_id].stock < quantity
+            ]
+            if out_of_stock:
+                raise serializers.ValidationError({'detail': f"Not enough stock for: {', '.join(out_of_stock)}"})
+
+            # Reserve stock for every line at once
+            now = timezone.now()
+            for product_id, quantity in quantities.items():
+                products[product_id].stock -= quantity
+                products[product_id].updated_at = now
+            Product.objects.bulk_update(products.values(), ['stock', 'updated_at'])
+            invalidate_catalog()  # bulk_update sends no signals, so refresh cached stock explicitly
 
-        for item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity,
-                price=item.product.price
-            )
-            total_price += item.product.price * item.quantity
+            total_price = sum((products[item.product_id].price * item.quantity for item in cart_items), Decimal('0'))
 
-        order.total_price = total_price
-        order.save()
+            order = Order.objects.create(user=user, total_price=total_price)
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=products[item.product_id],
+                    quantity=item.quantity,
+                    price=products[item.product_id].price
+                )
+                for item in cart_items
+            ])
 
-        # Clear the cart
-        cart_items.delete()
+            # Clear the cart
+            CartItem.objects.filter(id__in=[item.id for item in cart_items]).delete()
 
         return order
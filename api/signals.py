@@ -1,7 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile
+from .cache import invalidate_catalog, invalidate_cached_user
+from .models import Profile, Category, Product
 
 # Signal receiver to create a Profile instance when a new User is created
 @receiver(post_save, sender=User)
@@ -9,7 +10,13 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
 
-# Signal receiver to save the Profile instance whenever the User instance is saved
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+# Signal receiver to invalidate cached catalog listings whenever a product or category changes
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    invalidate_catalog()
+
+# Signal receiver to drop the cached authentication user whenever the User changes (e.g. deactivation)
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
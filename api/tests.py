@@ -1,3 +1,1028 @@
-from django.test import TestCase
+import contextlib
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from ecommerce_backend import fetch_product_images
+from . import catalog_io, payments, renderers
+from .cache import get_cache_stats, get_user_cache
+from .mail import claim_due_mail, queue_mail, send_queued_mail
+from .models import Cart, CartItem, Category, Order, OrderItem, OutboundEmail, Product, Profile
+from .renderers import FastJSONParser, FastJSONRenderer
+from .serializers import CategorySerializer, ProductSerializer
 
-# Create your tests here.
+
+# Shared fixtures: an authenticated client and a small catalog
+class APITestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Secr3t!pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Shirts')
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Shirt {i}', description='Cotton shirt', price=Decimal('1.50'), stock=100, category=self.category)
+            for i in range(40)
+        ])
+
+    def fill_cart(self, count, quantity=2):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=quantity) for product in self.products[:count]
+        ])
+        return cart
+
+    def count_queries(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = method(*args, **kwargs)
+        return response, len(queries)
+
+
+class CartDetailTests(APITestCase):
+    def test_query_count_does_not_grow_with_cart_size(self):
+        counts = []
+        for size in (1, 30):
+            CartItem.objects.all().delete()
+            self.fill_cart(size)
+            response, queries = self.count_queries(self.client.get, '/api/cart/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['items']), size)
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[1])
+
+
+class IndexUsageTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')  # Tiny test tables would otherwise always be scanned
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+
+    def test_product_list_uses_created_index(self):
+        self.assertUsesIndex(Product.objects.order_by('-created_at', '-id')[:10], 'product_created_id_idx')
+
+    def test_product_list_by_category_uses_category_index(self):
+        queryset = Product.objects.filter(category=self.category).order_by('-created_at', '-id')[:10]
+        self.assertUsesIndex(queryset, 'product_category_created_idx')
+
+    def test_product_name_lookup_uses_name_index(self):
+        self.assertUsesIndex(Product.objects.filter(name='Shirt 1'), 'product_name_idx')
+
+    def test_order_history_uses_user_created_index(self):
+        queryset = Order.objects.filter(user=self.user).order_by('-created_at', '-id')[:10]
+        self.assertUsesIndex(queryset, 'order_user_created_idx')
+
+    def test_cart_line_lookup_uses_unique_constraint(self):
+        cart = self.fill_cart(1)
+        queryset = CartItem.objects.filter(cart=cart, product=self.products[0])
+        self.assertUsesIndex(queryset, 'unique_cart_product', 'sqlite_autoindex_api_cartitem')
+
+
+class ProfileQueryTests(TestCase):
+    def profile_queries(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = method(*args, **kwargs)
+        return response, [query['sql'] for query in queries if 'api_profile' in query['sql']]
+
+    def test_registration_creates_profile_once(self):
+        response, queries = self.profile_queries(
+            APIClient().post, '/api/register/',
+            {'username': 'newuser', 'email': 'new@example.com', 'password': 'Secr3t!pass'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(queries), 1, queries)
+        self.assertEqual(Profile.objects.filter(user__username='newuser').count(), 1)
+
+    def test_login_does_not_touch_profile(self):
+        User.objects.create_user('shopper', 'shopper@example.com', 'Secr3t!pass')
+        response, queries = self.profile_queries(
+            APIClient().post, '/api/login/', {'username': 'shopper', 'password': 'Secr3t!pass'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_profile_saved_only_when_changed(self):
+        user = User.objects.create_user('shopper', 'shopper@example.com', 'Secr3t!pass')
+        client = APIClient()
+        client.force_authenticate(user)
+        data = {'username': 'shopper', 'email': 'shopper@example.com', 'profile': {'phone_number': '555-0100'}}
+
+        response, queries = self.profile_queries(client.put, '/api/profile/', data, format='json')
+        self.assertEqual(response.data['profile']['phone_number'], '555-0100')
+        self.assertTrue(any(sql.startswith('UPDATE') for sql in queries), queries)
+
+        response, queries = self.profile_queries(client.put, '/api/profile/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(sql.startswith('UPDATE') for sql in queries), queries)
+
+
+class ConcurrentAddToCartTests(TransactionTestCase):
+    THREADS = 8
+    ADDS_PER_THREAD = 10
+
+    def test_concurrent_adds_lose_no_increments(self):
+        user = User.objects.create_user('shopper', 'shopper@example.com', 'Secr3t!pass')
+        product = Product.objects.create(name='Shirt', description='Cotton shirt', price=Decimal('1.50'), stock=1000)
+        statuses = []
+
+        # SQLite's shared in-memory test database rejects concurrent writers with "database table is locked"
+        # instead of waiting; AddToCart logs that and changes nothing, so exactly those adds are retried.
+        # Other databases make the writers wait, and nothing may be logged.
+        sqlite = connection.vendor == 'sqlite'
+        logs = self.assertLogs('api.views', 'ERROR') if sqlite else self.assertNoLogs('api.views', 'ERROR')
+
+        with logs as captured:
+            def lock_errors():
+                ident = threading.get_ident()
+                return sum(
+                    1 for record in (captured.records if captured else [])
+                    if record.thread == ident and 'database table is locked' in record.getMessage()
+                )
+
+            def add_repeatedly():
+                client = APIClient()
+                client.force_authenticate(user)
+                try:
+                    for _ in range(self.ADDS_PER_THREAD):
+                        for _ in range(100):
+                            locked = lock_errors()
+                            response = client.post('/api/cart/add/', {'product_id': product.id, 'quantity': 1}, format='json')
+                            if response.status_code == 201 or lock_errors() == locked:
+                                break
+                        statuses.append(response.status_code)
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=add_repeatedly) for _ in range(self.THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        if sqlite:
+            self.assertEqual([record.getMessage() for record in captured.records if 'database table is locked' not in record.getMessage()], [])
+        self.assertEqual(statuses, [201] * self.THREADS * self.ADDS_PER_THREAD)
+        self.assertEqual(CartItem.objects.get(product=product).quantity, self.THREADS * self.ADDS_PER_THREAD)
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    VALUES = [
+        None,
+        {'a': 1},
+        [1, 2.5, 'é', 'x y', True, None],
+        Decimal('12.50'),
+        datetime.datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+        datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone(datetime.timedelta(hours=2))),
+        datetime.datetime(2024, 1, 1),
+        datetime.date(2024, 1, 2),
+        datetime.time(1, 2, 3, 456789),
+        datetime.timedelta(seconds=5),
+        uuid.UUID(int=5),
+        ErrorDetail('bad'),
+        gettext_lazy('hi'),
+        {1, 2},
+        2 ** 70,
+        'line\u2028separator\u2029',
+    ]
+
+    def assertSameOutput(self, data, accepted_media_type=None):
+        self.assertEqual(
+            FastJSONRenderer().render(data, accepted_media_type),
+            JSONRenderer().render(data, accepted_media_type),
+            data,
+        )
+
+    def test_matches_json_renderer(self):
+        for value in self.VALUES:
+            with self.subTest(value=value):
+                self.assertSameOutput({'value': value})
+
+    def test_indented_output_matches(self):
+        self.assertSameOutput({'price': Decimal('1.50'), 'items': [1, 2]}, 'application/json; indent=4')
+
+    def test_matches_without_orjson(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            for value in self.VALUES:
+                with self.subTest(value=value):
+                    self.assertSameOutput({'value': value})
+
+    def test_parser(self):
+        self.assertEqual(FastJSONParser().parse(io.BytesIO('{"a": [1, "é"]}'.encode())), {'a': [1, 'é']})
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"a": '))
+
+
+class FastJSONEndpointTests(APITestCase):
+    def test_product_list_matches_json_renderer(self):
+        response = self.client.get('/api/products/?page_size=100')
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_json_request_bodies_are_parsed(self):
+        response = self.client.post('/api/cart/add/', {'product_id': self.products[0].id, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['quantity'], 2)
+
+
+class SendQueuedMailTests(TestCase):
+    def queue(self):
+        return queue_mail('Subject', 'Body', 'shop@example.com', ['customer@example.com'])
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1', EMAIL_PORT=1)
+    def test_smtp_outage_backs_off_instead_of_raising(self):
+        email = self.queue()
+
+        result = send_queued_mail()
+
+        email.refresh_from_db()
+        self.assertEqual(result['failed'], 1)
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertGreater(email.next_attempt_at, email.created_at)
+        self.assertTrue(email.last_error)
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1', EMAIL_PORT=1)
+    def test_worker_survives_smtp_outage(self):
+        self.queue()
+        call_command('send_queued_email', '--once', stdout=io.StringIO())
+        self.assertEqual(OutboundEmail.objects.get().attempts, 1)
+
+    def test_sends_due_email(self):
+        email = self.queue()
+
+        result = send_queued_mail()
+
+        email.refresh_from_db()
+        self.assertEqual(result['sent'], 1)
+        self.assertEqual(len(result['latencies']), 1)
+        self.assertEqual((email.status, email.attempts), ('sent', 1))
+
+    def test_claimed_email_is_not_claimed_again(self):
+        self.queue()
+        self.assertEqual(len(claim_due_mail(10)), 1)
+        self.assertEqual(claim_due_mail(10), [])
+
+    def test_crash_mid_batch_keeps_sent_email_sent(self):
+        first, second = self.queue(), self.queue()
+        with mock.patch.object(EmailMessage, 'send', side_effect=[1, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                send_queued_mail()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, 'sent')
+        self.assertEqual((second.status, second.attempts), ('pending', 0))
+        self.assertGreater(second.next_attempt_at, timezone.now())  # Claimed: due again once the claim expires
+        self.assertEqual(send_queued_mail()['sent'], 0)  # Nothing is resent in the meantime
+
+
+class PaymentIntentTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.cart = self.fill_cart(2)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.idempotency_keys = []
+        patcher = mock.patch.object(payments, 'create_payment_intent', side_effect=self.fake_create_payment_intent)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def fake_create_payment_intent(self, amount, idempotency_key):
+        self.idempotency_keys.append(idempotency_key)
+        return {'client_secret': f'secret-{len(self.idempotency_keys)}'}
+
+    def pay_for_cart(self):
+        return async_to_sync(self.async_client.post)(
+            '/api/create-payment-intent/', {'cart_id': self.cart.id}, content_type='application/json', headers=self.headers,
+        )
+
+    def test_cart_amount_is_computed_server_side(self):
+        response = self.pay_for_cart()
+        self.assertEqual(response.json()['amount'], 600)  # 2 lines x 2 x $1.50
+
+    def test_retry_reuses_the_cart_intent(self):
+        self.pay_for_cart()
+        self.pay_for_cart()
+        self.assertEqual(len(set(self.idempotency_keys)), 1)
+
+    def test_new_purchase_with_the_same_total_gets_a_new_intent(self):
+        self.pay_for_cart()
+        CartItem.objects.filter(cart=self.cart).delete()  # Checkout empties the cart but keeps it
+        self.fill_cart(2)
+        self.pay_for_cart()
+        self.assertEqual(len(set(self.idempotency_keys)), 2)
+
+    def test_requires_authentication(self):
+        response = async_to_sync(self.async_client.post)(
+            '/api/create-payment-intent/', {'cart_id': self.cart.id}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class CatalogCacheTests(APITestCase):
+    def test_cached_body_follows_database_state(self):
+        first = self.client.get('/api/products/?page_size=5')
+        newest = self.products[-1]
+
+        # A write that bypasses the invalidation signals, as in another process
+        Product.objects.filter(pk=newest.pk).update(name='Renamed shirt', updated_at=timezone.now())
+        second = self.client.get('/api/products/?page_size=5')
+
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(second.data['results'][0]['name'], 'Renamed shirt')
+        third = self.client.get('/api/products/?page_size=5', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, 200)
+
+    def test_repeat_request_is_a_cache_hit(self):
+        self.client.get('/api/products/?page_size=5')
+        before = get_cache_stats()
+        response, queries = self.count_queries(self.client.get, '/api/products/?page_size=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 1)  # Only the validator aggregate
+        self.assertEqual(get_cache_stats()['hits'], before['hits'] + 1)
+
+    def test_validator_reads_only_the_served_page(self):
+        first = self.client.get('/api/products/?pagination=cursor&page_size=5')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(first.data['next'])
+        self.assertEqual(response.status_code, 200)
+        product_queries = [query['sql'] for query in queries if 'api_product' in query['sql']]
+        self.assertTrue(product_queries)
+        for sql in product_queries:
+            self.assertNotIn('COUNT(', sql.upper())
+            self.assertIn('LIMIT', sql)
+
+    def test_delete_outside_the_page_changes_the_etag(self):
+        first = self.client.get('/api/products/?page_size=5')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].delete()  # Oldest product, on the last page
+        second = self.client.get('/api/products/?page_size=5', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['count'], len(self.products) - 1)
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.client.get('/api/catalog/cache-stats/').status_code, 403)
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'Secr3t!pass'))
+        response = admin.get('/api/catalog/cache-stats/')
+        self.assertEqual(set(response.data), {'hits', 'misses', 'hit_ratio'})
+
+
+class ProductExportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'Secr3t!pass')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(admin)}'}
+
+    async def read_export(self, file_format):
+        response = await self.async_client.get(f'/api/products/export/?file_format={file_format}', headers=self.headers)
+        self.assertTrue(response.is_async)  # Streamed chunk by chunk under ASGI, never collected into a list
+        return b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+
+    def test_jsonl_export(self):
+        lines = async_to_sync(self.read_export)('jsonl')
+        self.assertEqual(len(lines), len(self.products))
+
+    def test_csv_export(self):
+        lines = async_to_sync(self.read_export)('csv')
+        self.assertEqual(lines[0], 'sku,name,description,price,stock,category,image')
+        self.assertEqual(len(lines), len(self.products) + 1)
+
+    def test_export_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/products/export/').status_code, 403)
+
+
+class ProductImportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'Secr3t!pass'))
+
+    def upload(self, name, content):
+        return self.admin.post('/api/products/import/', {'file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    def test_upserts_on_sku(self):
+        response = self.upload('products.jsonl', (
+            b'{"sku": "A1", "name": "Linen shirt", "price": "2.50", "category": "Linen"}\n'
+            b'{"sku": "A1", "name": "Linen shirt v2", "price": "3"}\n'
+        ))
+        self.assertEqual(response.data, {'imported': 1, 'errors': [], 'error_count': 0})
+        self.assertEqual(Product.objects.get(sku='A1').name, 'Linen shirt v2')
+
+    def test_malformed_jsonl_rows_are_skipped_and_reported(self):
+        response = self.upload('products.jsonl', (
+            b'not json\n'
+            b'[1, 2]\n'
+            b'{"sku": "B1", "name": "Shirt", "price": "NaN"}\n'
+            b'{"sku": "B2", "name": "Shirt", "price": "123456789012.50"}\n'
+            b'{"sku": "B3", "name": "Shirt", "price": "1.50", "stock": "lots"}\n'
+            b'{"sku": "B4", "name": "Shirt", "price": 1.5, "category": 7}\n'
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual([error.split(':')[0] for error in response.data['errors']], [f'Row {i}' for i in range(1, 6)])
+        self.assertEqual(Product.objects.get(sku='B4').category.name, '7')
+
+    def test_csv_with_byte_order_mark(self):
+        response = self.upload('products.csv', '\ufeffsku,name,price\nD1,Shirt,1.50\n'.encode())
+        self.assertEqual(response.data['errors'], [])
+        self.assertTrue(Product.objects.filter(sku='D1').exists())
+
+    def test_reported_errors_are_capped(self):
+        response = self.upload('products.jsonl', b'not json\n' * (catalog_io.MAX_REPORTED_ERRORS + 5))
+        self.assertEqual(len(response.data['errors']), catalog_io.MAX_REPORTED_ERRORS)
+        self.assertEqual(response.data['error_count'], catalog_io.MAX_REPORTED_ERRORS + 5)
+
+    def test_invalid_csv_rows_are_skipped_and_reported(self):
+        response = self.upload('products.csv', (
+            b'sku,name,price,stock\n'
+            b'C1,Shirt,1.50,3\n'
+            b'C2,Shirt,Infinity,3\n'
+            b',Shirt,1.50,3\n'
+        ))
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(len(response.data['errors']), 2)
+
+
+class CompressionMiddlewareTests(APITestCase):
+    def test_large_json_is_compressed(self):
+        plain = self.client.get('/api/products/?page_size=40')
+        response = self.client.get('/api/products/?page_size=40', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_small_json_is_not_compressed(self):
+        response = self.client.get('/api/categories/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},  # No collectstatic manifest in tests
+    })
+    def test_html_is_not_compressed(self):
+        response = self.client.get('/admin/login/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_refused_encoding_is_not_used(self):
+        response = self.client.get('/api/products/?page_size=40', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streamed_feed_is_compressed(self):
+        async def read_feed():
+            response = await self.async_client.get('/api/products/feed/', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        lines = gzip.decompress(async_to_sync(read_feed)()).splitlines()
+        self.assertEqual(len(lines), len(self.products))
+
+
+class CheckoutTests(APITestCase):
+    def checkout(self):
+        return self.client.post('/api/orders/create/', {}, format='json')
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        counts = []
+        for size in (1, 30):
+            self.fill_cart(size)
+            response, queries = self.count_queries(self.checkout)
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertEqual(len(response.data['items']), size)
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_reserves_stock_and_empties_cart(self):
+        self.fill_cart(2, quantity=3)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('9.00'))
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 97)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_rejects_short_stock(self):
+        Product.objects.filter(pk=self.products[0].pk).update(stock=1)
+        self.fill_cart(1, quantity=2)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 1)
+        self.assertFalse(Order.objects.exists())
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_cart_lines_are_locked_before_they_are_read(self):
+        self.fill_cart(2)
+        with CaptureQueriesContext(connection) as queries:
+            self.checkout()
+        line_reads = [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'FROM "api_cartitem"' in query['sql']]
+        self.assertTrue(line_reads)
+        self.assertTrue(all('FOR UPDATE' in sql for sql in line_reads), line_reads)
+
+    def test_second_checkout_of_the_same_cart_is_rejected(self):
+        self.fill_cart(2)
+        self.assertEqual(self.checkout().status_code, 201)
+        self.assertEqual(self.checkout().status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class ProductFeedTests(APITestCase):
+    def read_feed(self, query=''):
+        async def read():
+            response = await self.async_client.get(f'/api/products/feed/{query}')
+            return response.status_code, b''.join([chunk async for chunk in response.streaming_content])
+
+        status_code, body = async_to_sync(read)()
+        self.assertEqual(status_code, 200)
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_resume_within_a_shared_timestamp(self):
+        Product.objects.update(updated_at=timezone.now())  # One timestamp for the whole batch, as bulk writes do
+        rows = self.read_feed()
+        last_seen = rows[4]
+
+        resumed = self.read_feed(f"?since={last_seen['updated_at']}&since_id={last_seen['id']}")
+
+        self.assertEqual([row['id'] for row in resumed], [row['id'] for row in rows[5:]])
+
+    def test_since_returns_later_changes(self):
+        rows = self.read_feed()
+        self.assertEqual(self.read_feed(f"?since={rows[-1]['updated_at']}"), [])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/products/feed/?since=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/feed/?since_id=5').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/feed/?since=2024-01-01T00:00:00Z&since_id=x').status_code, 400)
+
+
+class ProductFieldsTests(APITestCase):
+    def test_sparse_fieldset_narrows_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/?fields=id,name,price')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price'})
+        page_query = [query['sql'] for query in queries if 'LIMIT' in query['sql']][0]
+        self.assertNotIn('description', page_query)
+
+    def test_unknown_fields_are_ignored(self):
+        response = self.client.get('/api/products/?fields=name,nope')
+        self.assertEqual(set(response.data['results'][0]), {'name'})
+
+    def test_only_unknown_fields_fall_back_to_full_representation(self):
+        full = self.client.get('/api/products/')
+        response = self.client.get('/api/products/?fields=nope')
+        self.assertEqual(response.data['results'], full.data['results'])
+
+    def test_card_view(self):
+        response = self.client.get('/api/products/?view=card')
+        self.assertEqual(set(response.data['results'][0]), set(Product.CARD_FIELDS))
+        self.fill_cart(1)
+        cart = self.client.get('/api/cart/')
+        self.assertEqual(set(cart.data['items'][0]['product']), set(Product.CARD_FIELDS))
+
+
+class OrderHistoryTests(APITestCase):
+    def place_orders(self, count, lines=5):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, total_price=Decimal('7.50'))
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, price=product.price)
+                for product in self.products[:lines]
+            ])
+
+    def item_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in queries if 'api_orderitem' in query['sql']]
+
+    def test_query_count_does_not_grow_with_history(self):
+        counts = []
+        for count in (1, 12):
+            Order.objects.all().delete()
+            self.place_orders(count)
+            response, queries = self.count_queries(self.client.get, '/api/order-history/?embed=product')
+            self.assertEqual(len(response.data['results']), min(count, 10))
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_products_are_not_loaded_without_embed(self):
+        self.place_orders(1)
+        response, queries = self.item_queries('/api/order-history/')
+        self.assertNotIn('product_summary', response.data['results'][0]['items'][0])
+        self.assertNotIn('api_product', queries[0])
+
+    def test_embedded_products_read_only_card_columns(self):
+        self.place_orders(1)
+        response, queries = self.item_queries('/api/order-history/?embed=product')
+        summary = response.data['results'][0]['items'][0]['product_summary']
+        self.assertEqual(set(summary), set(Product.CARD_FIELDS))
+        self.assertIn('api_product', queries[0])
+        self.assertNotIn('description', queries[0])
+        self.assertNotIn('search_vector', queries[0])
+
+
+class CartStockTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.products[0]
+        Product.objects.filter(pk=self.product.pk).update(stock=5)
+
+    def add(self, quantity):
+        return self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': quantity}, format='json')
+
+    def batch(self, *operations):
+        return self.client.post('/api/cart/batch/', {'operations': list(operations)}, format='json')
+
+    def line_quantity(self):
+        return CartItem.objects.get(product=self.product).quantity
+
+    def test_repeated_adds_cannot_exceed_stock(self):
+        self.assertEqual(self.add(3).status_code, 201)
+        self.assertEqual(self.add(3).status_code, 400)
+        self.assertEqual(self.line_quantity(), 3)
+        self.assertEqual(self.add(2).status_code, 201)
+        self.assertEqual(self.line_quantity(), 5)
+
+    def test_batch_add_checks_the_resulting_line(self):
+        self.add(4)
+        response = self.batch(
+            {'product_id': self.products[1].id, 'quantity': 1},
+            {'product_id': self.product.id, 'quantity': 2, 'op': 'add'},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.line_quantity(), 4)
+        self.assertFalse(CartItem.objects.filter(product=self.products[1]).exists())  # The whole batch is undone
+
+    def test_batch_set_replaces_the_line(self):
+        self.add(4)
+        response = self.batch({'product_id': self.product.id, 'quantity': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.line_quantity(), 5)
+
+
+class CartBatchFoldingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.products[0]
+        self.cart = self.fill_cart(1, quantity=4)
+
+    def batch(self, *operations):
+        response = self.client.post('/api/cart/batch/', {'operations': [
+            {'product_id': self.product.id, 'quantity': quantity, 'op': op} for op, quantity in operations
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return list(CartItem.objects.filter(cart=self.cart).values_list('product_id', 'quantity'))
+
+    def test_remove_then_add_replaces_the_line(self):
+        self.assertEqual(self.batch(('remove', 0), ('add', 2)), [(self.product.id, 2)])
+
+    def test_remove_then_add_nothing_removes_the_line(self):
+        self.assertEqual(self.batch(('remove', 0), ('add', 0)), [])
+
+    def test_set_then_add(self):
+        self.assertEqual(self.batch(('set', 3), ('add', 2)), [(self.product.id, 5)])
+
+    def test_set_zero_removes_the_line(self):
+        self.assertEqual(self.batch(('set', 0)), [])
+
+    def test_add_nothing_to_a_missing_line_creates_no_line(self):
+        CartItem.objects.all().delete()
+        self.assertEqual(self.batch(('add', 0)), [])
+
+
+# Local stand-in for the Unsplash search API: one photo per query, after any rate-limit responses queued for it
+class StubUnsplashHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)['query'][0]
+        self.server.queries.append(query)
+        if self.server.rate_limited.get(query):
+            self.server.rate_limited[query] -= 1
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+
+        results = [] if query in self.server.no_results else [
+            {'urls': {'regular': f'https://images.example.com/{query}.jpg'}, 'likes': 1}
+        ]
+        body = json.dumps({'results': results})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetchProductImagesTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubUnsplashHandler)
+        self.server.queries = []
+        self.server.rate_limited = {}
+        self.server.no_results = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        patcher = mock.patch.object(fetch_product_images, 'base_url', f'http://127.0.0.1:{self.server.server_port}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'checkpoint')
+        self.keyword_cache = os.path.join(directory.name, 'keywords.sqlite3')
+
+    def create_products(self, *names):
+        return [Product.objects.create(name=name, description='', price=Decimal('1.50')) for name in names]
+
+    def run_fetcher(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetch_product_images.main([
+                '--checkpoint', self.checkpoint, '--cache', self.keyword_cache, '--rate', '1000', '--workers', '2', *args,
+            ])
+
+    def images(self):
+        return dict(Product.objects.values_list('name', 'image'))
+
+    def test_rate_limited_lookup_is_retried(self):
+        self.create_products('Mug')
+        self.server.rate_limited['mug'] = 2
+
+        self.run_fetcher()
+
+        self.assertEqual(self.server.queries, ['mug'] * 3)
+        self.assertEqual(self.images(), {'Mug': 'https://images.example.com/mug.jpg'})
+
+    def test_checkpoint_does_not_pass_a_failed_lookup(self):
+        _, mug, _ = self.create_products('Lamp', 'Mug', 'Scarf')
+        self.server.rate_limited['mug'] = fetch_product_images.RATE_LIMIT_MAX_RETRIES + 1  # Never gets through
+
+        self.run_fetcher('--batch-size', '1')
+
+        self.assertEqual(self.images()['Mug'], None)
+        self.assertIsNotNone(self.images()['Scarf'])
+        self.assertEqual(fetch_product_images.load_checkpoint(self.checkpoint), mug.id - 1)
+
+        self.run_fetcher()  # Resumes before the failed product
+
+        self.assertEqual(self.images()['Mug'], 'https://images.example.com/mug.jpg')
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_variants_share_one_lookup_and_repeat_runs_stay_offline(self):
+        self.create_products('Mug (XL)', 'Mug - Small', 'Lamp')
+        self.server.no_results.add('lamp')
+
+        self.run_fetcher()
+        self.assertEqual(sorted(self.server.queries), ['lamp', 'mug'])
+
+        Product.objects.update(image=None)  # Everything is missing an image again
+        self.server.queries.clear()
+        self.run_fetcher('--restart')
+
+        self.assertEqual(self.server.queries, [])  # Served from the keyword cache, including the empty result
+        self.assertEqual(self.images()['Mug - Small'], 'https://images.example.com/mug.jpg')
+
+    def test_resumes_from_the_checkpoint_after_a_crash(self):
+        self.create_products('Lamp', 'Mug', 'Scarf', 'Watch')
+        self.server.no_results.update(['lamp', 'mug'])  # Still without an image after the first batch
+        search_keywords = fetch_product_images.search_keywords
+        batches = []
+
+        def crash_on_second_batch(keywords, *args):
+            batches.append(keywords)
+            if len(batches) == 2:
+                raise KeyboardInterrupt
+            return search_keywords(keywords, *args)
+
+        with mock.patch.object(fetch_product_images, 'search_keywords', side_effect=crash_on_second_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_fetcher('--batch-size', '2')
+
+        os.remove(self.keyword_cache)  # Only the checkpoint should keep the first batch from being fetched again
+        self.server.queries.clear()
+        self.run_fetcher('--batch-size', '2')
+
+        self.assertEqual(sorted(self.server.queries), ['scarf', 'watch'])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+
+class FetchProductImagesHelperTests(SimpleTestCase):
+    def test_normalize_keyword_collapses_variants(self):
+        names = ['Blue T-Shirt (XL)', 'blue t-shirt [2 pack]', 'Blue T-Shirt - Small', 'BLUE T SHIRT size M']
+        self.assertEqual({fetch_product_images.normalize_keyword(name) for name in names}, {'blue t shirt'})
+
+    def test_token_bucket_paces_requests(self):
+        bucket = fetch_product_images.TokenBucket(rate=50, capacity=1)
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 5 / 50 * 0.9)  # The burst of one, then one per 20ms
+
+    def test_token_bucket_pause_holds_requests(self):
+        bucket = fetch_product_images.TokenBucket(rate=1000, capacity=10)
+        bucket.pause(0.1)
+        started = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def keyword_cache(self, **kwargs):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = fetch_product_images.KeywordCache(os.path.join(directory.name, 'keywords.sqlite3'), **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_keyword_cache_entries_expire(self):
+        cache = self.keyword_cache(ttl=60, max_entries=10)
+        with mock.patch('time.time', return_value=1000):
+            cache.set_many({'mug': [{'id': 1}]})
+            self.assertEqual(cache.get_many(['mug']), {'mug': [{'id': 1}]})
+        with mock.patch('time.time', return_value=1061):
+            self.assertEqual(cache.get_many(['mug']), {})
+
+    def test_keyword_cache_evicts_least_recently_used(self):
+        cache = self.keyword_cache(ttl=60, max_entries=2)
+        with mock.patch('time.time', return_value=1000):
+            cache.set_many({'lamp': [], 'mug': []})
+        with mock.patch('time.time', return_value=1001):
+            cache.get_many(['lamp'])  # Mug is now the least recently used
+        with mock.patch('time.time', return_value=1002):
+            cache.set_many({'scarf': []})
+            self.assertEqual(set(cache.get_many(['lamp', 'mug', 'scarf'])), {'lamp', 'scarf'})
+
+
+class ReorderTests(APITestCase):
+    def place_order(self, lines, quantity=3):
+        order = Order.objects.create(user=self.user, total_price=Decimal('1.50'))
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+            for product in self.products[:lines]
+        ])
+        return order
+
+    def reorder(self, order):
+        return self.client.post(f'/api/order-history/reorder/{order.id}/')
+
+    def test_query_count_does_not_grow_with_order_size(self):
+        Cart.objects.create(user=self.user)  # So neither run pays for creating the cart
+        counts = []
+        for lines in (2, 30):
+            CartItem.objects.all().delete()
+            response, queries = self.count_queries(self.reorder, self.place_order(lines))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(CartItem.objects.count(), lines)
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_merges_into_existing_cart_lines(self):
+        self.fill_cart(2, quantity=2)  # Products 0 and 1 are already in the cart
+        self.reorder(self.place_order(3))
+        quantities = dict(CartItem.objects.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {
+            self.products[0].id: 5,
+            self.products[1].id: 5,
+            self.products[2].id: 3,
+        })
+
+    def test_other_users_orders_are_not_found(self):
+        order = self.place_order(2)
+        order.user = User.objects.create_user('other', 'other@example.com', 'Secr3t!pass')
+        order.save()
+        self.assertEqual(self.reorder(order).status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class ValuesSerializerTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        Category.objects.create(name='Hats', description=None)
+        Product.objects.create(sku='X-1', name='Odd product', description='', price=Decimal('19.9'), stock=0, image='x.jpg')
+
+    # The fast path's rows must render to the same bytes as the serializer over the same instances, in order
+    def assertMatchesSerializer(self, url, serializer_class, **serializer_kwargs):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertTrue(rows)
+        instances = serializer_class.Meta.model.objects.in_bulk([row['id'] for row in rows])
+        expected = serializer_class([instances[row['id']] for row in rows], many=True, **serializer_kwargs).data
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(expected))
+        return response
+
+    def test_full_product_page(self):
+        self.assertMatchesSerializer('/api/products/?page_size=100', ProductSerializer)
+
+    def test_sparse_fieldset(self):
+        fields = ['id', 'name', 'price', 'created_at']
+        self.assertMatchesSerializer(f'/api/products/?fields={",".join(fields)}', ProductSerializer, fields=fields)
+
+    def test_card_view(self):
+        self.assertMatchesSerializer('/api/products/?view=card', ProductSerializer, fields=Product.CARD_FIELDS)
+
+    def test_cursor_pages(self):
+        response = self.assertMatchesSerializer('/api/products/?pagination=cursor&page_size=15', ProductSerializer)
+        self.assertMatchesSerializer(response.data['next'], ProductSerializer)
+
+    def test_categories(self):
+        self.assertMatchesSerializer('/api/categories/', CategorySerializer)
+
+
+class CachedUserAuthenticationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        get_user_cache().clear()  # Ids are reused between tests, so start without cached users
+
+    def get_cart(self, user=None, token=None):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token or AccessToken.for_user(user or self.user)}')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/cart/')
+        return response, [query['sql'] for query in queries if 'auth_user' in query['sql']]
+
+    def test_cache_hit_skips_the_user_query(self):
+        response, queries = self.get_cart()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+        response, queries = self.get_cart()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_deactivated_user_is_rejected_once_the_change_commits(self):
+        self.assertEqual(self.get_cart()[0].status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.get_cart()[0].status_code, 401)
+
+    def test_revoked_token_is_rejected_on_a_cache_hit(self):
+        with mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            old_token = AccessToken.for_user(self.user)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.set_password('N3w!password')
+                self.user.save()
+
+            response, queries = self.get_cart()  # A token issued after the change caches the updated user
+            self.assertEqual(response.status_code, 200)
+            response, queries = self.get_cart(token=old_token)
+            self.assertEqual(queries, [])  # Served from the cache, and still checked
+            self.assertEqual(response.status_code, 401)
+
+
+class ProductCursorPaginationTests(APITestCase):
+    def test_walking_next_links_visits_every_product_once(self):
+        url = '/api/products/?pagination=cursor&page_size=7'
+        seen = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse([query['sql'] for query in queries if 'COUNT(' in query['sql'].upper()])
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)  # No duplicates, no gaps, newest first
+
+
+class ProductSearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        # The name match is older, so only its rank can put it first
+        self.by_name = Product.objects.create(name='Linen trousers', description='Relaxed fit', price=Decimal('19.99'))
+        self.by_description = Product.objects.create(name='Summer shirt', description='Light shirt made of linen', price=Decimal('9.99'))
+
+    def search(self, query):
+        response = self.client.get(f'/api/products/?search={query}')
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_matches_descriptions_and_ranks_name_matches_first(self):
+        self.assertEqual(self.search('linen'), [self.by_name.id, self.by_description.id])
+
+    def test_no_match(self):
+        self.assertEqual(self.search('velvet'), [])
@@ -4,7 +4,8 @@ from .views import MyTokenObtainPairView
 from django.contrib.auth import views as auth_views
 from .views import (
     RegisterView, UserProfileUpdateView, CategoryList, ProductList, ProductDetail,
-    CartDetail, AddToCart, UpdateCartItem, OrderCreate, OrderHistoryView,
+    ProductImportView, ProductExportView, ProductFeedView, CatalogCacheStatsView,
+    CartDetail, AddToCart, CartBatchUpdate, UpdateCartItem, OrderCreate, OrderHistoryView,
     ClearOrderHistoryView, create_payment_intent, reorder, PasswordResetView
 )
 
@@ -28,10 +29,15 @@ urlpatterns = [
     # Product endpoints
     path('products/', ProductList.as_view(), name='product-list'),
     path('products/<int:pk>/', ProductDetail.as_view(), name='product-detail'),
+    path('products/import/', ProductImportView.as_view(), name='product-import'),
+    path('products/export/', ProductExportView.as_view(), name='product-export'),
+    path('products/feed/', ProductFeedView.as_view(), name='product-feed'),
+    path('catalog/cache-stats/', CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
     
     # Cart endpoints
     path('cart/', CartDetail.as_view(), name='cart-detail'),
     path('cart/add/', AddToCart.as_view(), name='add-to-cart'),
+    path('cart/batch/', CartBatchUpdate.as_view(), name='cart-batch'),
     path('cart/update/<int:pk>/', UpdateCartItem.as_view(), name='update-cart-item'),
     
     # Order endpoints
@@ -1,27 +1,42 @@
 from django.shortcuts import render
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
-import stripe
 from django.conf import settings
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.parsers import MultiPartParser
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import AllowAny
-from django.http import HttpResponse
-from rest_framework.pagination import PageNumberPagination
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Min, Prefetch, Q, Sum
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.generics import ListCreateAPIView
 from rest_framework import generics, status
 from .models import Category, Product, Cart, CartItem, Order, OrderItem
-from .serializers import UserSerializer, RegisterSerializer, CategorySerializer, ProductSerializer, CartSerializer, CartItemSerializer, OrderSerializer, OrderItemSerializer, MyTokenObtainPairSerializer
+from . import payments
+from .authentication import CachedUserJWTAuthentication
+from .mail import queue_mail
+from .catalog_io import FORMATS, aexport_products, format_from_name, import_products, read_rows
+from .cache import get_catalog_cache, get_catalog_version, catalog_cache_key, get_cache_stats, record_cache_lookup
+from .serializers import UserSerializer, RegisterSerializer, CategorySerializer, ProductSerializer, CartSerializer, CartItemSerializer, CartBatchSerializer, OrderSerializer, OrderItemSerializer, MyTokenObtainPairSerializer, ValuesSerializer
+from collections import defaultdict
+import datetime
+import hashlib
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
 # Custom Token Obtain Pair View for JWT authentication
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
@@ -50,10 +65,139 @@ class UserProfileUpdateView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
+# Mixin serving GET responses of catalog views from the versioned read-through cache.
+# Entries are keyed by the validator ConditionalCatalogMixin computes from the rows being served (so it
+# must come first in the bases): a body is never served under an ETag it wasn't rendered for, even after
+# writes that skip the invalidation signals or happen in another process.
+class CatalogCacheMixin:
+    cache_prefix = None
+    cache_query_params = ()
+
+    def get(self, request, *args, **kwargs):
+        validator = getattr(self, 'catalog_validator', None)
+        if validator is None:
+            return super().get(request, *args, **kwargs)  # Nothing to validate against (e.g. an empty listing)
+
+        cache = get_catalog_cache()
+        key = catalog_cache_key(self.cache_prefix, request, self.cache_query_params, kwargs, validator)
+        data = cache.get(key)
+        record_cache_lookup(data is not None)
+        if data is not None:
+            return Response(data)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+        return response
+
+# Mixin answering conditional GETs (If-None-Match / If-Modified-Since) for catalog views from the
+# (id, updated_at) of the rows being served - the object, or the requested page of a list - before
+# anything is serialized. Deletions outside the page, which only change a listing's count, are caught
+# by the catalog version that every product and category delete bumps, so no COUNT is needed.
+class ConditionalCatalogMixin:
+    def get_served_rows(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in self.kwargs:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            return list(queryset.values_list('id', 'updated_at'))
+
+        paginator = self.paginator
+        if isinstance(paginator, CursorPagination):
+            # The cursor page itself, read by a fresh paginator so the view's own paginator state is untouched
+            ordering = [field.lstrip('-') for field in paginator.ordering]
+            page = type(paginator)().paginate_queryset(queryset.values('id', 'updated_at', *ordering), self.request, view=self)
+            return [(row['id'], row['updated_at']) for row in page or []]
+        if isinstance(paginator, PageNumberPagination):
+            page_size = paginator.get_page_size(self.request)
+            if not page_size:
+                return list(queryset.values_list('id', 'updated_at'))
+            try:
+                page_number = int(self.request.query_params.get(paginator.page_query_param, 1))
+            except ValueError:
+                return []  # e.g. ?page=last, which needs the count; served without a validator
+            if page_number < 1:
+                return []
+            start = (page_number - 1) * page_size
+            return list(queryset.values_list('id', 'updated_at')[start:start + page_size])
+        return list(queryset.values_list('id', 'updated_at'))  # Unpaginated: every row is served
+
+    def get(self, request, *args, **kwargs):
+        rows = self.get_served_rows()
+        if not rows:
+            return super().get(request, *args, **kwargs)
+
+        last_modified = max(updated_at for _, updated_at in rows)
+        ids = ','.join(str(pk) for pk, _ in rows)
+        self.catalog_validator = hashlib.md5(f'{get_catalog_version()}|{last_modified.isoformat()}|{ids}'.encode()).hexdigest()
+        etag = quote_etag(hashlib.md5(f'{request.get_full_path()}|{self.catalog_validator}'.encode()).hexdigest())
+        last_modified_timestamp = int(last_modified.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified_timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response.headers['ETag'] = etag
+            response.headers['Last-Modified'] = http_date(last_modified_timestamp)
+        return response
+
+# Mixin serving list GETs through ValuesSerializer: rows come from .values() and skip model
+# instantiation and per-row serializer machinery, with output identical to the serializer's
+class FastListMixin:
+    def list(self, request, *args, **kwargs):
+        values_serializer = ValuesSerializer(self.get_serializer())
+        sources = values_serializer.sources
+
+        # Cursor pagination reads its position from the ordering fields, so always fetch them
+        paginator = self.paginator
+        ordering = getattr(paginator, 'ordering', None) if isinstance(paginator, CursorPagination) else None
+        if ordering:
+            sources += [field.lstrip('-') for field in ordering if field.lstrip('-') not in sources]
+
+        queryset = self.filter_queryset(self.get_queryset()).values(*sources)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(values_serializer.to_representation(page))
+        return Response(values_serializer.to_representation(queryset))
+
 # Category List and Create View
-class CategoryList(generics.ListCreateAPIView):
+class CategoryList(ConditionalCatalogMixin, CatalogCacheMixin, FastListMixin, generics.ListCreateAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_prefix = 'categories'
+
+# Mixin for product views serving sparse fieldsets on GET: ?fields=id,name,price,image or ?view=card.
+# Only the requested columns are fetched from the database. Unknown field names are ignored, and a
+# selection with no known names falls back to the full representation.
+class ProductFieldsMixin:
+    def get_requested_fields(self):
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = self.parse_requested_fields()
+        return self._requested_fields
+
+    def parse_requested_fields(self):
+        if self.request.method != 'GET':
+            return None
+        params = self.request.query_params
+        if params.get('view') == 'card':
+            return Product.CARD_FIELDS
+        if params.get('fields'):
+            known = set(self.get_serializer_class()().fields)
+            fields = [field.strip() for field in params['fields'].split(',') if field.strip() in known]
+            return fields or None
+        return None
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_requested_fields()
+        if fields is not None:
+            model_fields = {field.name for field in Product._meta.concrete_fields}
+            queryset = queryset.only('id', *[field for field in fields if field in model_fields])
+        return queryset
 
 # Pagination configuration for Product List View
 class ProductPagination(PageNumberPagination):
@@ -61,13 +205,34 @@ class ProductPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+# Opt-in cursor pagination for Product List View (?pagination=cursor), which skips the
+# COUNT query and keeps deep pages as cheap as the first one
+class ProductCursorPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')  # Backed by the (created_at, id) index on Product
+
 # Product List View with search and filter capabilities
-class ProductList(ListCreateAPIView):
+class ProductList(ConditionalCatalogMixin, CatalogCacheMixin, FastListMixin, ProductFieldsMixin, ListCreateAPIView):
+    queryset = Product.objects.order_by('-created_at', '-id')
     serializer_class = ProductSerializer
     pagination_class = ProductPagination
+    cache_prefix = 'products'
+    cache_query_params = ('category_id', 'search', 'page', 'page_size', 'pagination', 'cursor', 'fields', 'view')
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or 'cursor' in params:
+                self._paginator = ProductCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
-        queryset = Product.objects.all()
+        queryset = super().get_queryset()
         category_id = self.request.query_params.get('category_id')
         search_query = self.request.query_params.get('search')
         
@@ -75,14 +240,96 @@ class ProductList(ListCreateAPIView):
             queryset = queryset.filter(category_id=category_id)
         
         if search_query is not None:
-            queryset = queryset.filter(name__icontains=search_query)
+            queryset = queryset.search(search_query)
         
         return queryset
 
+# Admin-only hit/miss counters of the catalog cache (for the serving process)
+class CatalogCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        stats = get_cache_stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0
+        return Response(stats)
+
+# Admin-only view to import products from an uploaded CSV/JSONL file (field "file")
+class ProductImportView(APIView):
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.query_params.get('file_format') or format_from_name(upload.name)
+        if fmt not in FORMATS:
+            return Response({'error': f'file_format must be one of {FORMATS}'}, status=status.HTTP_400_BAD_REQUEST)
+        result = import_products(read_rows(upload, fmt))
+        return Response(result, status=status.HTTP_200_OK)
+
+# Admin-only view streaming the whole catalog as CSV or JSONL (?file_format=jsonl; DRF reserves ?format=)
+class ProductExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        fmt = 'jsonl' if request.query_params.get('file_format') == 'jsonl' else 'csv'
+        response = StreamingHttpResponse(
+            aexport_products(fmt),
+            content_type='application/x-ndjson' if fmt == 'jsonl' else 'text/csv',
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
+
+# Product fields emitted by the catalog feed, one JSON object per line
+PRODUCT_FEED_FIELDS = ['id', 'sku', 'name', 'description', 'price', 'stock', 'image', 'created_at', 'updated_at', 'category']
+
+# Async generator yielding one NDJSON line per product, read through a server-side cursor in chunks
+async def product_feed_lines(queryset, chunk_size=1000):
+    async for product in queryset.values(*PRODUCT_FEED_FIELDS).aiterator(chunk_size=chunk_size):
+        product['price'] = str(product['price'])
+        product['created_at'] = product['created_at'].isoformat().replace('+00:00', 'Z')
+        product['updated_at'] = product['updated_at'].isoformat().replace('+00:00', 'Z')
+        yield json.dumps(product) + '\n'
+
+# Streaming NDJSON feed of the whole catalog for partners and indexers, ordered by (updated_at, id).
+# Resume with ?since=<updated_at>&since_id=<id> of the last row received: the (updated_at, id) keyset
+# picks up rows sharing that timestamp, which batch writes (checkout, imports) produce. ?since alone
+# returns rows changed strictly after the timestamp.
+class ProductFeedView(APIView):
+    def get(self, request, *args, **kwargs):
+        queryset = Product.objects.order_by('updated_at', 'id')
+        since = request.query_params.get('since')
+        since_id = request.query_params.get('since_id')
+        if since_id and not since:
+            return Response({'error': 'since_id requires since'}, status=status.HTTP_400_BAD_REQUEST)
+        if since:
+            since_datetime = parse_datetime(since)
+            if since_datetime is None:
+                return Response({'error': 'since must be an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since_datetime):
+                since_datetime = timezone.make_aware(since_datetime, datetime.timezone.utc)
+            if since_id:
+                try:
+                    since_id = int(since_id)
+                except ValueError:
+                    return Response({'error': 'since_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+                queryset = queryset.filter(
+                    Q(updated_at__gt=since_datetime) | Q(updated_at=since_datetime, id__gt=since_id)
+                )
+            else:
+                queryset = queryset.filter(updated_at__gt=since_datetime)
+
+        return StreamingHttpResponse(product_feed_lines(queryset), content_type='application/x-ndjson')
+
 # Product Detail View for retrieving, updating, and deleting products
-class ProductDetail(generics.RetrieveUpdateDestroyAPIView):
+class ProductDetail(ConditionalCatalogMixin, CatalogCacheMixin, ProductFieldsMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    cache_prefix = 'product'
+    cache_query_params = ('fields', 'view')
 
 # Cart Detail View for retrieving and updating the cart
 class CartDetail(generics.RetrieveUpdateAPIView):
@@ -91,7 +338,7 @@ class CartDetail(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         try:
-            cart, created = Cart.objects.get_or_create(user=self.request.user)
+            cart, created = Cart.objects.with_items().get_or_create(user=self.request.user)
             return cart
         except Exception as e:
             logger.error(f"Failed to fetch cart: {e}")
@@ -104,12 +351,24 @@ class AddToCart(generics.CreateAPIView):
 
     def create(self, request, *args, **kwargs):
         try:
+            quantity = int(request.data.get('quantity', 1))
+            if quantity < 1:
+                return Response({'detail': 'Quantity must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
             cart, created = Cart.objects.get_or_create(user=self.request.user)
             product = Product.objects.get(id=request.data['product_id'])
-            cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-            if not created:
-                cart_item.quantity += request.data['quantity']
-                cart_item.save()
+            if product.stock < quantity:
+                return Response({'detail': 'Not enough stock'}, status=status.HTTP_400_BAD_REQUEST)
+
+            with transaction.atomic():
+                # Single atomic upsert: concurrent adds to the same line can't lose increments
+                cart_item, = CartItem.objects.add_quantities(cart.id, {product.id: quantity})
+                # Stock has to cover the whole resulting line, not just this addition; the upsert holds
+                # the line's row lock, so concurrent adds are checked against each other's totals
+                if cart_item.quantity > product.stock:
+                    transaction.set_rollback(True)
+                    return Response({'detail': 'Not enough stock'}, status=status.HTTP_400_BAD_REQUEST)
+            cart_item.product = product  # Reuse the product we already loaded for the response
             serializer = self.get_serializer(cart_item)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except Product.DoesNotExist:
@@ -119,6 +378,78 @@ class AddToCart(generics.CreateAPIView):
             logger.error(f'Error adding to cart: {e}')
             return Response({'detail': 'Error adding to cart'}, status=status.HTTP_400_BAD_REQUEST)
 
+# View to apply a batch of cart operations (set/add/remove) in one request and one transaction
+class CartBatchUpdate(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = CartBatchSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Collapse the operations, in order, into one final change per product
+        changes = {}
+        for operation in serializer.validated_data['operations']:
+            product_id, quantity, op = operation['product_id'], operation['quantity'], operation['op']
+            previous = changes.get(product_id)
+            if op == 'remove':
+                changes[product_id] = ('remove', 0)
+            elif op == 'add' and previous is not None and previous[0] != 'add':
+                changes[product_id] = ('set', previous[1] + quantity)  # Adding on top of a set (or removed) line
+            elif op == 'add':
+                changes[product_id] = ('add', (previous[1] if previous else 0) + quantity)
+            else:
+                changes[product_id] = ('set', quantity)
+
+        # A line set to 0 is removed, and adding nothing changes nothing, so no line is ever written with quantity 0
+        for product_id, (op, quantity) in list(changes.items()):
+            if op == 'set' and quantity == 0:
+                changes[product_id] = ('remove', 0)
+            elif op == 'add' and quantity == 0:
+                del changes[product_id]
+
+        with transaction.atomic():
+            cart, created = Cart.objects.get_or_create(user=request.user)
+            products = Product.objects.only('id', 'stock').in_bulk(list(changes))
+
+            missing = [product_id for product_id in changes if product_id not in products]
+            if missing:
+                return Response({'detail': f'Products not found: {missing}'}, status=status.HTTP_400_BAD_REQUEST)
+            out_of_stock = [
+                product_id for product_id, (op, quantity) in changes.items()
+                if op != 'remove' and products[product_id].stock < quantity
+            ]
+            if out_of_stock:
+                return Response({'detail': f'Not enough stock for products: {out_of_stock}'}, status=status.HTTP_400_BAD_REQUEST)
+
+            to_set = [
+                CartItem(cart=cart, product_id=product_id, quantity=quantity)
+                for product_id, (op, quantity) in changes.items() if op == 'set'
+            ]
+            to_add = {product_id: quantity for product_id, (op, quantity) in changes.items() if op == 'add'}
+            to_remove = [product_id for product_id, (op, quantity) in changes.items() if op == 'remove']
+
+            if to_set:
+                CartItem.objects.bulk_create(
+                    to_set,
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity', 'updated_at'],
+                )
+            added_lines = CartItem.objects.add_quantities(cart.id, to_add)
+            if to_remove:
+                CartItem.objects.filter(cart=cart, product_id__in=to_remove).delete()
+
+            # Added quantities land on top of existing lines, so check the resulting totals too
+            out_of_stock = [line.product_id for line in added_lines if line.quantity > products[line.product_id].stock]
+            if out_of_stock:
+                transaction.set_rollback(True)
+                return Response({'detail': f'Not enough stock for products: {out_of_stock}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        cart = Cart.objects.with_items().get(pk=cart.pk)
+        return Response(CartSerializer(cart, context=self.get_serializer_context()).data)
+
 # View to update or delete items in the cart
 class UpdateCartItem(generics.RetrieveUpdateDestroyAPIView):
     queryset = CartItem.objects.all()
@@ -162,13 +493,36 @@ class OrderCreate(generics.CreateAPIView):
             logger.error(f"Order creation failed: {serializer.errors}")
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-# View to list order history
+# Cursor pagination for Order History View, newest orders first
+class OrderHistoryPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')  # Backed by the (user, created_at) index on Order
+
+# View to list order history, with items and products prefetched (?embed=product adds a product summary per item)
 class OrderHistoryView(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderHistoryPagination
+
+    def embed_product(self):
+        return self.request.query_params.get('embed') == 'product'
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        # Items render their product as an id unless a summary is embedded, and then only the card columns are read
+        items = OrderItem.objects.all()
+        if self.embed_product():
+            items = items.select_related('product').only(
+                'id', 'order_id', 'product_id', 'quantity', 'price',
+                *[f'product__{field}' for field in Product.CARD_FIELDS],
+            )
+        return Order.objects.filter(user=self.request.user).prefetch_related(Prefetch('items', queryset=items))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['embed_product'] = self.embed_product()
+        return context
 
 # View to clear order history
 class ClearOrderHistoryView(APIView):
@@ -180,37 +534,84 @@ class ClearOrderHistoryView(APIView):
         orders.delete()
         return Response({"message": "Order history cleared."}, status=status.HTTP_204_NO_CONTENT)
 
-# View to reorder items from a past order
+# View to reorder items from a past order, merging all of its lines into the cart in one upsert
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def reorder(request, order_id):
     try:
-        order = Order.objects.get(id=order_id, user=request.user)
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        for item in order.items.all():
-            cart_item, created = CartItem.objects.get_or_create(cart=cart, product=item.product)
-            if not created:
-                cart_item.quantity += item.quantity
-                cart_item.save()
+        with transaction.atomic():
+            quantities = defaultdict(int)
+            for product_id, quantity in OrderItem.objects.filter(
+                order_id=order_id, order__user=request.user
+            ).values_list('product_id', 'quantity'):
+                quantities[product_id] += quantity
+
+            if not quantities and not Order.objects.filter(id=order_id, user=request.user).exists():
+                raise Order.DoesNotExist
+
+            cart, created = Cart.objects.get_or_create(user=request.user)
+            CartItem.objects.add_quantities(cart.id, quantities)
         return Response({"message": "Items added to cart"}, status=status.HTTP_200_OK)
     except Order.DoesNotExist:
         return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-# View to create a Stripe payment intent
-@api_view(['POST'])
-def create_payment_intent(request):
+# Async view to create a Stripe payment intent, so the Stripe round-trip doesn't pin a worker thread.
+# The amount is computed server-side from the user's persisted order (order_id) or cart (cart_id).
+async def create_payment_intent(request):
+    if request.method != 'POST':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
     try:
-        total_price = request.data['total_price']
-        intent = stripe.PaymentIntent.create(
-            amount=int(total_price * 100),  # amount in cents
-            currency='usd',
-            metadata={'integration_check': 'accept_a_payment'},
+        auth = await sync_to_async(CachedUserJWTAuthentication().authenticate)(request)
+    except (AuthenticationFailed, InvalidToken) as e:
+        return JsonResponse({'detail': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+    if auth is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+    user = auth[0]
+
+    try:
+        data = json.loads(request.body or b'{}') if request.content_type == 'application/json' else request.POST
+        order_id = data.get('order_id')
+        cart_id = data.get('cart_id')
+
+        # One aggregate query: SUM(price * quantity) over the lines the user owns
+        if order_id:
+            lines = OrderItem.objects.filter(order_id=order_id, order__user=user)
+            line_total = F('price') * F('quantity')
+            aggregates = {}
+        elif cart_id:
+            lines = CartItem.objects.filter(cart_id=cart_id, cart__user=user)
+            line_total = F('product__price') * F('quantity')
+            # The cart outlives each purchase (checkout only deletes its lines), so its idempotency key
+            # also identifies the current set of lines, which is new after every checkout or edit
+            aggregates = {'first_line': Min('id'), 'last_line': Max('id'), 'line_count': Count('id'), 'last_change': Max('updated_at')}
+        else:
+            return JsonResponse({'error': 'order_id or cart_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        totals = await lines.aaggregate(
+            total=Sum(line_total, output_field=DecimalField(max_digits=12, decimal_places=2)),
+            **aggregates,
         )
-        return Response({'clientSecret': intent['client_secret']})
+        if not totals['total']:
+            return JsonResponse({'error': 'Nothing to pay for'}, status=status.HTTP_400_BAD_REQUEST)
+        amount = int(totals['total'] * 100)  # amount in cents
+
+        # Retries for the same order (or unchanged cart) and amount reuse the intent Stripe already created
+        if order_id:
+            idempotency_key = f'payment-intent-order-{order_id}-{amount}'
+        else:
+            idempotency_key = (
+                f"payment-intent-cart-{cart_id}-{totals['first_line']}-{totals['last_line']}-{totals['line_count']}-"
+                f"{totals['last_change'].timestamp()}-{amount}"
+            )
+        intent = await payments.create_payment_intent(amount, idempotency_key)
+        return JsonResponse({'clientSecret': intent['client_secret'], 'amount': amount})
     except Exception as e:
-        return Response({'error': str(e)}, status=400)
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+create_payment_intent.csrf_exempt = True  # Token-authenticated API endpoint, like the DRF views
 
 # View to handle password reset
 class PasswordResetView(APIView):
@@ -221,13 +622,12 @@ class PasswordResetView(APIView):
 
         try:
             user = User.objects.get(email=email)
-            # Logic for sending the password reset email
-            send_mail(
+            # Queue the password reset email; the send_queued_email worker delivers it
+            queue_mail(
                 'Password Reset',
                 'Here is the link to reset your password: <reset link>',
                 settings.DEFAULT_FROM_EMAIL,
                 [email],
-                fail_silently=False,
             )
             return Response({'success': 'Password reset email sent'}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
@@ -0,0 +1,59 @@
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from common import test_database
+from django.contrib.auth.models import User
+from django.db import connection
+from rest_framework.test import APIClient
+from api.models import Cart, CartItem, OrderItem, Product
+
+# Fire many parallel checkouts at one hot product and report throughput and oversell.
+# Run against PostgreSQL (DATABASE_URL) for meaningful numbers: SQLite's in-memory test database
+# rejects concurrent writers, which shows up as errors rather than waits.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Concurrent checkout benchmark on a single hot product.')
+    parser.add_argument('--checkouts', type=int, default=300, help='Number of customers checking out at once')
+    parser.add_argument('--stock', type=int, default=100, help='Units of the hot product in stock')
+    parser.add_argument('--workers', type=int, default=32, help='Concurrent request threads')
+    return parser.parse_args()
+
+
+def checkout(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    try:
+        return client.post('/api/orders/create/', {}, format='json').status_code
+    except Exception:
+        return 'error'
+    finally:
+        connection.close()
+
+
+def main():
+    args = parse_args()
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)  # Failed requests are counted, not logged
+    with test_database():
+        product = Product.objects.create(name='Flash sale shirt', description='Hot product', price=Decimal('9.99'), stock=args.stock)
+        users = User.objects.bulk_create([User(username=f'customer{i}') for i in range(args.checkouts)])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1) for cart in carts])
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            statuses = list(executor.map(checkout, users))
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        sold = sum(OrderItem.objects.filter(product=product).values_list('quantity', flat=True))
+        print(f'{args.checkouts} checkouts on {args.stock} units with {args.workers} workers ({connection.vendor})')
+        print(f'Completed in {elapsed:.2f}s: {args.checkouts / elapsed:.1f} checkouts/s')
+        print(f'Accepted {statuses.count(201)}, rejected {statuses.count(400)}, errors {statuses.count("error")}')
+        print(f'Units sold {sold}, stock left {product.stock}, oversold {max(0, sold - args.stock)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+import django
+
+# Append the project directory to the system path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Setup Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_backend.settings')
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from api.models import Category, Product
+
+
+# Run a benchmark against a throwaway test database, so it never touches real data.
+# Point DATABASE_URL at PostgreSQL to measure the production code paths.
+@contextmanager
+def test_database():
+    setup_test_environment(debug=False)  # As the test runner does, so queries aren't logged
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+# Words product names are built from, so searches match a realistic share of the catalog
+COLORS = ['red', 'blue', 'green', 'black', 'white', 'grey', 'navy', 'olive']
+ITEMS = ['shirt', 'jacket', 'sneakers', 'jeans', 'hoodie', 'scarf', 'backpack', 'watch', 'lamp', 'mug']
+
+
+# Insert products numbered start..count-1 spread over a few categories, in batches
+def seed_products(count, start=0, batch_size=5000, description='Soft cotton shirt with a classic fit. ' * 8):
+    categories = list(Category.objects.all()) or Category.objects.bulk_create(
+        [Category(name=f'Category {i}') for i in range(10)]
+    )
+    for batch_start in range(start, count, batch_size):
+        Product.objects.bulk_create([
+            Product(
+                sku=f'SKU-{i}',
+                name=f'{COLORS[i % len(COLORS)].title()} {ITEMS[i // len(COLORS) % len(ITEMS)]} {i}',
+                description=description,
+                price=Decimal('19.99'),
+                stock=100,
+                category=categories[i % len(categories)],
+                image=f'https://images.example.com/{i}.jpg',
+            )
+            for i in range(batch_start, min(batch_start + batch_size, count))
+        ])
+
+
+# Call fn repeat times and return the duration of each call in seconds
+def measure(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def percentile(durations, pct):
+    ordered = sorted(durations)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+# One line of a results table: label, then p50/p99 in milliseconds
+def format_latency(label, durations):
+    return f'{label:<48} p50 {percentile(durations, 50) * 1000:8.3f} ms   p99 {percentile(durations, 99) * 1000:8.3f} ms'
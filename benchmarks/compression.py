@@ -0,0 +1,52 @@
+import argparse
+from common import measure, seed_products, test_database
+from rest_framework.test import APIClient
+from api import middleware
+from api.middleware import BrotliCompressor, GzipCompressor
+
+# CPU time against bytes saved for gzip levels and brotli qualities on typical listing pages
+
+PAGES = [
+    '/api/products/?page_size=10',
+    '/api/products/?page_size=100',
+    '/api/products/?page_size=100&view=card',
+]
+GZIP_LEVELS = [1, 4, 6, 9]
+BROTLI_QUALITIES = [1, 4, 6, 11]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Response compression CPU vs bytes benchmark.')
+    parser.add_argument('--repeat', type=int, default=100, help='Compressions per page and setting')
+    return parser.parse_args()
+
+
+def compress(compressor_class, level, content):
+    compressor = compressor_class(level)
+    return compressor.compress(content) + compressor.finish()
+
+
+def main():
+    args = parse_args()
+    settings = [('gzip', GzipCompressor, level) for level in GZIP_LEVELS]
+    if middleware.brotli is not None:
+        settings += [('br', BrotliCompressor, quality) for quality in BROTLI_QUALITIES]
+
+    with test_database():
+        seed_products(100)
+        client = APIClient()
+        for url in PAGES:
+            content = client.get(url).content
+            print(f'{url} ({len(content)} bytes)')
+            for encoding, compressor_class, level in settings:
+                size = len(compress(compressor_class, level, content))
+                durations = measure(lambda: compress(compressor_class, level, content), args.repeat)
+                median = sorted(durations)[len(durations) // 2]
+                print(
+                    f'  {encoding:<4} level {level:<3} {size:7d} bytes ({size / len(content):6.1%})'
+                    f'  {median * 1000:7.3f} ms'
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+from unittest import mock
+from common import format_latency, measure, percentile, seed_products, test_database
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from api.renderers import FastJSONRenderer, orjson
+from api.views import ProductList
+
+# Throughput of GET /api/products/?page_size=100 rendered by DRF's JSONRenderer against FastJSONRenderer,
+# plus the render step alone on the same page data. Repeat requests are catalog cache hits, so the
+# request timings are dominated by rendering rather than by the page query.
+
+RENDERERS = [JSONRenderer, FastJSONRenderer]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='JSON renderer throughput benchmark on the product list.')
+    parser.add_argument('--page-size', type=int, default=100, help='Products per listing page')
+    parser.add_argument('--repeat', type=int, default=500, help='Requests (and renders) per renderer')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    url = f'/api/products/?page_size={args.page_size}'
+    with test_database():
+        seed_products(args.page_size)
+        client = APIClient()
+        data = client.get(url).data
+
+        # FastJSONRenderer has to stay byte-identical to the renderer it replaces
+        assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+        print(f'GET {url} (orjson {"available" if orjson is not None else "not installed"})')
+        for renderer_class in RENDERERS:
+            with mock.patch.object(ProductList, 'renderer_classes', [renderer_class]):
+                client.get(url)  # Warm the catalog cache
+                durations = measure(lambda: client.get(url), args.repeat)
+            throughput = len(durations) / sum(durations)
+            print(f'{format_latency(f"  {renderer_class.__name__} request", durations)}   {throughput:8.0f} req/s')
+
+            renderer = renderer_class()
+            durations = measure(lambda: renderer.render(data), args.repeat)
+            print(f'{format_latency(f"  {renderer_class.__name__} render only", durations)}'
+                  f'   {1 / percentile(durations, 50):8.0f} renders/s')
+
+
+if __name__ == '__main__':
+    main()
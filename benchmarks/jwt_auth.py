@@ -0,0 +1,51 @@
+import argparse
+from unittest import mock
+from common import format_latency, measure, seed_products, test_database
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from api.authentication import CachedUserJWTAuthentication
+from api.models import Cart, CartItem, Product
+from api.views import CartDetail, OrderHistoryView
+
+# Compare the per-request auth_user lookup of JWTAuthentication with CachedUserJWTAuthentication
+# on the cart endpoints, reporting latency and queries per request
+
+ENDPOINTS = [('/api/cart/', CartDetail), ('/api/order-history/', OrderHistoryView)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='JWT authentication benchmark on the cart endpoints.')
+    parser.add_argument('--repeat', type=int, default=500, help='Requests per endpoint and authenticator')
+    parser.add_argument('--cart-size', type=int, default=10, help='Lines in the benchmark cart')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with test_database():
+        seed_products(args.cart_size)
+        user = User.objects.create_user('shopper', 'shopper@example.com', 'Secr3t!pass')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product) for product in Product.objects.all()])
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+        for url, view in ENDPOINTS:
+            print(f'GET {url} ({connection.vendor})')
+            for authentication in (JWTAuthentication, CachedUserJWTAuthentication):
+                with mock.patch.object(view, 'authentication_classes', [authentication]):
+                    client.get(url)  # Warm the user cache
+                    with CaptureQueriesContext(connection) as queries:
+                        client.get(url)
+                    query_count = len(queries)  # Read now: each request clears the query log
+                    durations = measure(lambda: client.get(url), args.repeat)
+                print(format_latency(f'  {authentication.__name__} ({query_count} queries)', durations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import argparse
+from common import format_latency, measure, seed_products, test_database
+from rest_framework.renderers import JSONRenderer
+from api.models import Product
+from api.serializers import ProductSerializer
+
+# Payload size and fetch + serialize + render time of a product listing page,
+# full representation (before sparse fieldsets) against the card and a ?fields= selection
+
+VARIANTS = [
+    ('full', None),
+    ('view=card', Product.CARD_FIELDS),
+    ('fields=id,name,price', ['id', 'name', 'price']),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Product listing payload benchmark.')
+    parser.add_argument('--page-size', type=int, default=100, help='Products per listing page')
+    parser.add_argument('--repeat', type=int, default=200, help='Renders per variant')
+    return parser.parse_args()
+
+
+def render_page(fields, page_size):
+    queryset = Product.objects.order_by('-created_at', '-id')
+    if fields is not None:
+        queryset = queryset.only('id', *fields)
+    return JSONRenderer().render(ProductSerializer(queryset[:page_size], many=True, fields=fields).data)
+
+
+def main():
+    args = parse_args()
+    with test_database():
+        seed_products(args.page_size)
+        print(f'Listing page of {args.page_size} products')
+        for label, fields in VARIANTS:
+            size = len(render_page(fields, args.page_size))
+            durations = measure(lambda: render_page(fields, args.page_size), args.repeat)
+            print(format_latency(f'  {label} ({size} bytes)', durations))
+
+
+if __name__ == '__main__':
+    main()
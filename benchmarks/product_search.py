@@ -0,0 +1,45 @@
+import argparse
+from common import format_latency, measure, seed_products, test_database
+from django.db import connection
+from api.models import Product
+
+# Compare p50/p99 latency of Product.objects.search() against the old name__icontains filter.
+# Run against PostgreSQL (DATABASE_URL) to measure the tsvector/GIN path; SQLite uses the icontains fallback.
+
+QUERIES = ['shirt', 'blue jacket', 'cotton', 'navy watch 42', 'nothing matches this']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Product search latency benchmark.')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma-separated catalog sizes')
+    parser.add_argument('--repeat', type=int, default=50, help='Runs of each query per path')
+    parser.add_argument('--page-size', type=int, default=20, help='Results fetched per search')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+    with test_database():
+        seeded = 0
+        for size in sizes:
+            seed_products(size, start=seeded)
+            seeded = size
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE api_product')
+
+            print(f'{size} products ({connection.vendor})')
+            search, icontains = [], []
+            for query in QUERIES:
+                search += measure(lambda: list(Product.objects.search(query)[:args.page_size]), args.repeat)
+                icontains += measure(
+                    lambda: list(Product.objects.filter(name__icontains=query).order_by('-id')[:args.page_size]),
+                    args.repeat,
+                )
+            print(format_latency('  search()', search))
+            print(format_latency('  name__icontains', icontains))
+
+
+if __name__ == '__main__':
+    main()
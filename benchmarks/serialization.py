@@ -0,0 +1,49 @@
+import argparse
+from common import measure, seed_products, test_database
+from rest_framework.renderers import JSONRenderer
+from api.models import Category, Product
+from api.serializers import CategorySerializer, ProductSerializer, ValuesSerializer
+
+# Per-row serialization cost of the ModelSerializer path against the ValuesSerializer fast path
+# used by ProductList and CategoryList; rows are fetched up front so only serialization is timed
+
+CASES = [
+    ('ProductSerializer', Product, ProductSerializer),
+    ('CategorySerializer', Category, CategorySerializer),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serializer vs values() fast path microbenchmark.')
+    parser.add_argument('--rows', type=int, default=100, help='Rows serialized per run (one page)')
+    parser.add_argument('--repeat', type=int, default=200, help='Runs per path')
+    return parser.parse_args()
+
+
+def per_row_microseconds(durations, rows):
+    return sorted(durations)[len(durations) // 2] / rows * 1e6
+
+
+def main():
+    args = parse_args()
+    with test_database():
+        seed_products(args.rows)
+        for label, model, serializer_class in CASES:
+            instances = list(model.objects.order_by('id')[:args.rows])
+            values_serializer = ValuesSerializer(serializer_class())
+            rows = list(model.objects.order_by('id').values(*values_serializer.sources)[:args.rows])
+
+            # The fast path must stay byte-identical to the serializer it replaces
+            renderer = JSONRenderer()
+            assert renderer.render(serializer_class(instances, many=True).data) == \
+                renderer.render(values_serializer.to_representation(rows))
+
+            slow = measure(lambda: serializer_class(instances, many=True).data, args.repeat)
+            fast = measure(lambda: ValuesSerializer(serializer_class()).to_representation(rows), args.repeat)
+            print(f'{label} ({len(rows)} rows)')
+            print(f'  serializer        {per_row_microseconds(slow, len(rows)):8.2f} us/row')
+            print(f'  values fast path  {per_row_microseconds(fast, len(rows)):8.2f} us/row')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,16 @@
 import os
+import re
 import sys
+import json
+import sqlite3
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import django
 import requests
-import random
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 
 # Append the project directory to the system path
@@ -12,6 +20,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_backend.settings')
 django.setup()
 
+from django.utils import timezone
+from django.utils.http import parse_http_date_safe
+from api.cache import invalidate_catalog
 from api.models import Product  # Import your Product model
 
 # Access Unsplash API Access Key from Django settings
@@ -21,11 +32,139 @@ if not access_key:
     print('Unsplash API key is missing')
     sys.exit(1)
 
-# Base URL for the Unsplash API
-base_url = 'https://api.unsplash.com'
+# Base URL for the Unsplash API (override with UNSPLASH_API_URL, e.g. to point at a local stub server)
+base_url = os.environ.get('UNSPLASH_API_URL', 'https://api.unsplash.com')
+
+# Default location of the checkpoint file used to resume an interrupted run
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fetch_product_images.checkpoint')
+
+# Default location of the on-disk keyword -> search results cache
+DEFAULT_KEYWORD_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fetch_product_images.cache.sqlite3')
+
+# Hourly request quota of a production Unsplash application (demo applications get 50); the default --rate
+UNSPLASH_HOURLY_LIMIT = 5000
+
+# Backoff after an upstream rate-limit response without a Retry-After header: RATE_LIMIT_BASE_WAIT * 2 ** retry
+# seconds, capped at RATE_LIMIT_MAX_WAIT (Unsplash quotas reset hourly), for at most RATE_LIMIT_MAX_RETRIES retries
+RATE_LIMIT_BASE_WAIT = 60
+RATE_LIMIT_MAX_WAIT = 60 * 60
+RATE_LIMIT_MAX_RETRIES = 8
+
+# Size and variant words stripped from product names so variants share one search
+VARIANT_WORDS = {
+    'xxs', 'xs', 's', 'm', 'l', 'xl', 'xxl', 'xxxl', '2xl', '3xl',
+    'small', 'medium', 'large', 'size', 'pack', 'pk', 'x',
+}
+
+# Normalize a product name into the keyword sent upstream, e.g. "Blue T-Shirt (XL)" -> "blue t shirt"
+def normalize_keyword(name):
+    name = re.sub(r'\(.*?\)|\[.*?\]', ' ', name.lower())
+    words = re.findall(r'[a-z0-9]+', name)
+    return ' '.join(word for word in words if word not in VARIANT_WORDS) or name.strip()
+
+# Persistent keyword -> search results cache with a TTL and least-recently-used eviction
+class KeywordCache:
+    def __init__(self, path, ttl, max_entries):
+        self.ttl = ttl                  # Seconds a cached result stays valid
+        self.max_entries = max_entries  # Entries kept before the least recently used are evicted
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS keyword_results ('
+            'keyword TEXT PRIMARY KEY, results TEXT NOT NULL, fetched_at REAL NOT NULL, last_used REAL NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS keyword_results_last_used ON keyword_results (last_used)')
+
+    def get_many(self, keywords):
+        now = time.time()
+        found = {}
+        with self.connection:
+            for keyword in keywords:
+                row = self.connection.execute(
+                    'SELECT results FROM keyword_results WHERE keyword = ? AND fetched_at > ?',
+                    (keyword, now - self.ttl),
+                ).fetchone()
+                if row is not None:
+                    found[keyword] = json.loads(row[0])
+            self.connection.executemany(
+                'UPDATE keyword_results SET last_used = ? WHERE keyword = ?',
+                [(now, keyword) for keyword in found],
+            )
+        return found
 
-# Function to search for images based on a keyword
-def search_images(query, per_page=10, page=1):
+    def set_many(self, results):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO keyword_results (keyword, results, fetched_at, last_used) VALUES (?, ?, ?, ?)',
+                [(keyword, json.dumps(images), now, now) for keyword, images in results.items()],
+            )
+            self.connection.execute(
+                'DELETE FROM keyword_results WHERE keyword NOT IN '
+                '(SELECT keyword FROM keyword_results ORDER BY last_used DESC LIMIT ?)',
+                (self.max_entries,),
+            )
+
+    def close(self):
+        self.connection.close()
+
+# Token bucket limiting how many requests per second are sent upstream, shared by all workers
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate                # Tokens added per second
+        self.capacity = capacity        # Maximum burst size
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0           # Monotonic time before which no tokens are handed out
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    # Hold every worker for the given number of seconds (e.g. after a rate-limit response), then resume at rate
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self.updated = self.paused_until  # No tokens accrue while paused
+
+# Create an HTTP session whose connection pool is shared (and kept alive) across all workers
+def create_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# Whether a response means the upstream quota is used up: 429, or Unsplash's 403 with no requests remaining
+def is_rate_limited(response):
+    return response.status_code == 429 or (
+        response.status_code == 403 and response.headers.get('X-Ratelimit-Remaining') == '0'
+    )
+
+# Seconds to wait before retrying a rate-limited request: Retry-After (seconds or HTTP date) or exponential backoff
+def rate_limit_wait(response, retry):
+    retry_after = response.headers.get('Retry-After', '').strip()
+    if retry_after.isdigit():
+        return int(retry_after)
+    retry_at = parse_http_date_safe(retry_after) if retry_after else None
+    if retry_at is not None:
+        return max(0, retry_at - time.time())
+    return min(RATE_LIMIT_BASE_WAIT * 2 ** retry, RATE_LIMIT_MAX_WAIT)
+
+# Function to search for images based on a keyword; None when the lookup failed (as opposed to found nothing)
+def search_images(query, per_page=10, page=1, session=None, limiter=None, max_retries=RATE_LIMIT_MAX_RETRIES):
     search_endpoint = f'{base_url}/search/photos'
     params = {
         'query': query,
@@ -33,12 +172,33 @@ def search_images(query, per_page=10, page=1):
         'per_page': per_page,
         'page': page
     }
-    response = requests.get(search_endpoint, params=params)
+    for retry in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = (session or requests).get(search_endpoint, params=params, timeout=10)
+        except requests.RequestException as e:
+            print(f'Failed to fetch images: {e}')
+            return None
+        if not is_rate_limited(response) or retry == max_retries:
+            break
+
+        # Back off and retry; pausing the shared limiter holds the other workers too
+        wait = rate_limit_wait(response, retry)
+        print(f'Rate limited upstream ({response.status_code}), retrying "{query}" in {wait:.0f}s')
+        if limiter is not None:
+            limiter.pause(wait)
+        else:
+            time.sleep(wait)
+
     if response.status_code == 200:
+        if limiter is not None and response.headers.get('X-Ratelimit-Remaining') == '0':
+            limiter.pause(rate_limit_wait(response, 0))  # Quota used up: don't spend the next requests on 403s
         return response.json()['results']
     else:
+        # None (rather than no results) so failed lookups are retried instead of cached
         print(f'Failed to fetch images: {response.status_code}, {response.text}')
-        return []
+        return None
 
 # Function to select the best image from the results
 def select_best_image(images, strategy='first'):
@@ -56,27 +216,112 @@ def select_best_image(images, strategy='first'):
     else:
         return images[0]
 
+# Read the id of the last product handled by a previous run
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)['last_id']
+    except (FileNotFoundError, ValueError, KeyError):
+        return 0
+
+# Record the id of the last product handled, replacing the file atomically so a crash can't corrupt it
+def save_checkpoint(path, last_id):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'last_id': last_id}, f)
+    os.replace(tmp_path, path)
+
+# Look up search results for every keyword, going upstream only for keywords not already cached
+def search_keywords(keywords, keyword_cache, executor, session, limiter):
+    results = keyword_cache.get_many(keywords)
+    misses = [keyword for keyword in keywords if keyword not in results]
+    fetched = executor.map(lambda keyword: search_images(keyword, session=session, limiter=limiter), misses)
+    new_results = {keyword: images for keyword, images in zip(misses, fetched) if images is not None}
+    keyword_cache.set_many(new_results)
+    results.update(new_results)
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Fetch Unsplash images for products without one.')
+    parser.add_argument('--workers', type=int, default=8, help='Number of concurrent requests')
+    parser.add_argument('--rate', type=float, default=UNSPLASH_HOURLY_LIMIT / 3600,
+                        help='Maximum upstream requests per second (default: the hourly Unsplash quota spread evenly)')
+    parser.add_argument('--batch-size', type=int, default=200, help='Products fetched and saved per batch')
+    parser.add_argument('--strategy', default='first', help='Image selection strategy')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='Checkpoint file used to resume runs')
+    parser.add_argument('--restart', action='store_true', help='Ignore any existing checkpoint')
+    parser.add_argument('--cache', default=DEFAULT_KEYWORD_CACHE, help='On-disk keyword results cache')
+    parser.add_argument('--cache-ttl', type=float, default=30, help='Days cached search results stay valid')
+    parser.add_argument('--cache-size', type=int, default=100000, help='Maximum number of cached keywords')
+    return parser.parse_args(argv)
+
 # Main function to fetch and store images
-def main():
+def main(argv=None):
+    args = parse_args(argv)
+    last_id = 0 if args.restart else load_checkpoint(args.checkpoint)
+    if last_id:
+        print(f'Resuming after Product ID: {last_id}')
+
     # Fetch products with null image fields
-    products = Product.objects.filter(image__isnull=True)
-    if not products.exists():
+    products = Product.objects.filter(image__isnull=True).order_by('id')
+    if not products.filter(id__gt=last_id).exists():
         print('No products found without images')
         return
 
-    for product in products:
-        product_name = product.name
-        print(f'Searching images for product: {product_name}')
-        images = search_images(product_name)
-        best_image = select_best_image(images, strategy='first')
-        if best_image:
-            image_url = best_image['urls']['regular']
-            # Save image URL to the product's image field
-            product.image = image_url
-            product.save()
-            print(f'Updated image for Product ID: {product.id}')
-        else:
-            print(f'No image found for Product: {product_name}')
+    session = create_session(args.workers)
+    limiter = TokenBucket(args.rate, capacity=args.workers)
+    keyword_cache = KeywordCache(args.cache, ttl=args.cache_ttl * 24 * 60 * 60, max_entries=args.cache_size)
+    updated_count = 0
+    failed_count = 0
+    first_failed_id = None  # Products from here on are retried by the next run
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        while True:
+            batch = list(products.filter(id__gt=last_id).values_list('id', 'name')[:args.batch_size])
+            if not batch:
+                break
+
+            # Collapse names to normalized keywords so duplicates and variants cost one lookup
+            keywords = {product_id: normalize_keyword(product_name) for product_id, product_name in batch}
+            results = search_keywords(sorted(set(keywords.values())), keyword_cache, executor, session, limiter)
+
+            now = timezone.now()
+            updates = []
+            for product_id, product_name in batch:
+                if keywords[product_id] not in results:
+                    # The lookup failed (e.g. still rate limited after backing off), which isn't "no image"
+                    failed_count += 1
+                    if first_failed_id is None:
+                        first_failed_id = product_id
+                    continue
+                best_image = select_best_image(results[keywords[product_id]], strategy=args.strategy)
+                if best_image:
+                    updates.append(Product(id=product_id, image=best_image['urls']['regular'], updated_at=now))
+                else:
+                    print(f'No image found for Product: {product_name}')
+
+            # Save image URLs for the whole batch at once
+            Product.objects.bulk_update(updates, ['image', 'updated_at'])
+            if updates:
+                invalidate_catalog()  # bulk_update sends no signals
+            updated_count += len(updates)
+
+            # This run moves on, but the checkpoint never passes a failed lookup so a resumed run retries it;
+            # products updated after it no longer match image__isnull and aren't fetched again
+            last_id = batch[-1][0]
+            save_checkpoint(args.checkpoint, last_id if first_failed_id is None else first_failed_id - 1)
+            print(f'Updated {len(updates)} of {len(batch)} products (through Product ID: {last_id})')
+
+    keyword_cache.close()
+
+    if failed_count:
+        print(f'Done: updated images for {updated_count} products; {failed_count} lookups failed, run again to retry them')
+        return
+
+    # Finished cleanly, so the next run starts from the beginning
+    if os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    print(f'Done: updated images for {updated_count} products')
 
 if __name__ == '__main__':
     main()
@@ -24,6 +24,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'django-insecure-_qev&+^w#z^*nx1@_-vgg04iyxs9c+1g=hxd0a5m3-det%%!vc')
 
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY', 'sk_test_51PMLrxL6Ra3fxI3YgIdevVqeIOHlljiY1afSCfx8Rh4RR3Q67mUaN0V7f9pqrz2AP1t2P64onjt5cRcRp4PuqNbI00ouIJ65EQ')
+STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE')  # Override to point at a local fake Stripe server
+STRIPE_TIMEOUT = float(os.environ.get('STRIPE_TIMEOUT', 10))  # Seconds before an outbound Stripe call is abandoned
+STRIPE_MAX_NETWORK_RETRIES = int(os.environ.get('STRIPE_MAX_NETWORK_RETRIES', 2))
 UNSPLASH_SECRET_KEY = os.environ.get('UNSPLASH_SECRET_KEY', 'W6QdnPQaUc4sWRhhdos4jN6ZOwAHfHeCsROn4xrB0jQ')
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -59,10 +62,12 @@ AUTHENTICATION_BACKENDS = (
 )
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 10))  # Seconds before a blocking SMTP operation gives up, so a hung server can't stall the mail worker
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.CompressionMiddleware',  # After WhiteNoise, which serves its own pre-compressed static files
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -101,7 +106,7 @@ WSGI_APPLICATION = 'ecommerce_backend.wsgi.application'
 
 DATABASES = {
     'default': dj_database_url.config(
-         default=os.environ.get('DATABASE_URL'),
+         default=os.environ.get('DATABASE_URL', f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),  # SQLite for local development and tests
         conn_max_age=600,
         ssl_require=os.getenv('DATABASE_URL') is not None
     )
@@ -118,13 +123,58 @@ SIMPLE_JWT = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedUserJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Cache used for catalog listings and authenticated users. Set REDIS_URL (or CACHE_DIR) in any deployment with
+# more than one process: the local memory fallback is per process, so a cache.delete() in one process (e.g.
+# dropping a deactivated user) never reaches the others, and cached users stay valid there until
+# AUTH_USER_CACHE_TIMEOUT expires. Catalog entries are keyed by the rows they serve and the catalog version; with
+# a per-process version, a delete in one process is only seen by the others when it changes the rows of a page.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+elif os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))  # Seconds a cached listing is served
+
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 60))  # Seconds an authenticated user is served from cache
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))  # Bytes below which responses are sent uncompressed
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))  # 1 (fastest) to 9 (smallest)
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))  # 0 (fastest) to 11 (smallest)
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",